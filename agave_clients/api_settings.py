@@ -0,0 +1,59 @@
+# Lean settings for running the clients service as a stateless JSON API, as in the docker image: only the
+# apps, middleware and machinery the REST views need are loaded, which makes starting (and recycling) a
+# process cheaper. Use it with DJANGO_SETTINGS_MODULE=agave_clients.api_settings; measure the difference
+# with agave_clients/tests/importtime.py.
+import os
+
+from agave_clients.settings import *
+
+
+# No admin, sessions, messages, sites or static files. contrib.auth stays for rest_framework and the
+# common package, which import it.
+INSTALLED_APPS = (
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'agave_clients.service',
+    'rest_framework',
+    'corsheaders',
+)
+
+# Only the middleware the views need: requests are authenticated with HTTP basic auth by the views, and
+# nothing uses sessions, CSRF tokens or messages. CORS preflight requests are answered by the first
+# middleware without reaching the views; the other middleware only process its response.
+MIDDLEWARE_CLASSES = (
+    'corsheaders.middleware.CorsMiddleware',
+    'agave_clients.service.middleware.ServerTimingMiddleware',
+    'django.middleware.common.CommonMiddleware',
+)
+
+TEMPLATE_CONTEXT_PROCESSORS = ()
+
+# The service's messages are not translated.
+USE_I18N = False
+USE_L10N = False
+
+# The views authenticate requests themselves (agave_clients.service.auth), so rest_framework doesn't have
+# to, and doesn't have to load the user model to represent anonymous users.
+REST_FRAMEWORK = dict(REST_FRAMEWORK,
+                      DEFAULT_AUTHENTICATION_CLASSES=(),
+                      UNAUTHENTICATED_USER=None)
+
+# State shared by the mod_wsgi daemon processes (WSGI_PROCESSES in the Dockerfile). Listings, subscriptions,
+# their invalidations and provisioning jobs live in the default cache, which must be shared by every
+# process: set MEMCACHED_LOCATION (host:port[,host:port...]) when running more than one process. Without it
+# the cache is local to each process, and wsgi.py refuses to start more than one.
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'].split(','),
+        }
+    }
+    STORE_SESSION_BACKEND = 'agave_clients.service.sessions.DjangoCacheSessionBackend'
+
+# Each process writes its metrics here so that /clients/v2/_metrics reports all of them. The directory is
+# local to the container.
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/agave_clients_metrics')
+# Comma separated addresses the metrics are served to (e.g. the scraper's), in addition to localhost.
+if os.environ.get('METRICS_ALLOWED_ADDRESSES'):
+    METRICS_ALLOWED_ADDRESSES = METRICS_ALLOWED_ADDRESSES + os.environ['METRICS_ALLOWED_ADDRESSES'].split(',')
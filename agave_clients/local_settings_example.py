@@ -53,8 +53,6 @@ else:
     mysql_db = TENANT_HOST
     tenant_host = TENANT_HOST
 
-print "Using mysql_db: ", mysql_db
-print "Using tenant_host: ", tenant_host
 
 # ----------------------
 # DATABASE CONNECTIVITY
@@ -68,6 +66,9 @@ DATABASES = {
         'PASSWORD': mysql_pass,
         'HOST': mysql_db,
         'PORT': '3306',
+        # Seconds connections are kept open between requests (see APIM_DB_CONN_MAX_AGE). To pool the
+        # connections instead, set the ENGINE to 'agave_clients.service.mysql_pool' and CONN_MAX_AGE to 0.
+        'CONN_MAX_AGE': int(os.environ.get('mysql_conn_max_age', 300)),
         # When running the test suite, when this setting is True, the test runner will not create a
         # test database. This is required for the clients service tests, since they rely on
         # interactions with the APIM instance itself. If the clients service is writing data to a
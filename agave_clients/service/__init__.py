@@ -1 +1,3 @@
 __author__ = 'jstubbs'
+
+default_app_config = 'agave_clients.service.apps.ServiceConfig'
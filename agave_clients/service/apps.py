@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+
+
+class ServiceConfig(AppConfig):
+    name = 'agave_clients.service'
+
+    def ready(self):
+        from agave_clients.service import db
+        # connected after Django's own close_old_connections handlers, so these run after them.
+        connection_created.connect(db.connection_created, dispatch_uid='agave_clients.db.connection_created')
+        request_started.connect(db.check_connections, dispatch_uid='agave_clients.db.check_connections')
+        request_finished.connect(db.release_connections, dispatch_uid='agave_clients.db.release_connections')
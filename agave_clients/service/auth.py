@@ -0,0 +1,68 @@
+'''
+Authentication for the clients service views. With AUTH_FUNC = 'basicauth', requests authenticate with
+HTTP basic auth using their APIM credentials; the credentials are used to obtain a (cached) store session
+for the store calls made on the user's behalf. Any other AUTH_FUNC is handled by the common package's
+authenticated decorator, which logs in to the store on every request.
+'''
+
+import base64
+import functools
+import logging
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from common import auth as common_auth
+from common.error import Error
+from common.responses import error_dict
+
+from agave_clients.service.resilience import StoreUnavailable, unavailable_response
+from agave_clients.service.sessions import get_session
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def get_credentials(request):
+    """
+    Returns the (username, password) from the HTTP basic auth header of a request.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION')
+    if not header:
+        raise Error("Authorization header required.")
+    parts = header.split()
+    if not len(parts) == 2 or not parts[0].lower() == 'basic':
+        raise Error("Invalid Authorization header; HTTP basic auth is required.")
+    try:
+        username, password = base64.b64decode(parts[1]).split(':', 1)
+    except Exception:
+        raise Error("Invalid Authorization header; could not decode credentials.")
+    return username, password
+
+def authenticated(view):
+    """
+    Decorator for view methods requiring an authenticated user. Sets request.wso2_username and
+    request.wso2_cookies, the store session to use for store calls made on behalf of the user.
+    """
+    common_view = common_auth.authenticated(view)
+
+    @functools.wraps(view)
+    def _wrapper(self, request, *args, **kwargs):
+        if settings.AUTH_FUNC != 'basicauth':
+            # only basic auth credentials can be used to cache store sessions.
+            return common_view(self, request, *args, **kwargs)
+        try:
+            username, password = get_credentials(request)
+            request.wso2_cookies = get_session(username, password)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
+        except Error as e:
+            return Response(error_dict(msg=e.message), status.HTTP_401_UNAUTHORIZED)
+        except Exception as e:
+            logger.error("Uncaught exception trying to authenticate: " + str(e))
+            return Response(error_dict(msg="Unable to authenticate."), status.HTTP_401_UNAUTHORIZED)
+        request.wso2_username = username
+        return view(self, request, *args, **kwargs)
+    return _wrapper
@@ -0,0 +1,140 @@
+'''
+Short-lived caches of data read from the store and the APIM db, kept in the Django cache named by
+CLIENTS_CACHE_ALIAS so that they can be shared across processes. Entries are keyed by tenant and user and
+are invalidated explicitly by the views that change the underlying data.
+
+The application listing of each user, and the subscriptions of each client, also have a version stamp
+that changes whenever they are invalidated. Cached entries are tagged with the stamp current when their
+data was read, so that an entry written by a request that raced with a change is never served under the
+new stamp; the stamps are also the basis of the ETags of the user's resources.
+'''
+
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def get_cache():
+    return caches[settings.CLIENTS_CACHE_ALIAS]
+
+def user_key(kind, username, *parts):
+    """
+    Cache key for data of type kind belonging to username. Usernames and client names may contain
+    characters that are not valid in memcached keys, so they are hashed.
+    """
+    value = '\0'.join(force_bytes(part) for part in [settings.TENANT_HOST, username] + list(parts))
+    digest = hashlib.md5(value).hexdigest()
+    return 'agave_clients.' + kind + '.' + digest
+
+def get_version(username, *parts):
+    """
+    Returns the current version stamp of a user's data (of the user's application listing, or of the data
+    identified by parts, e.g. the subscriptions of a client), creating one if there is none.
+    """
+    cache = get_cache()
+    key = user_key('version', username, *parts)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, settings.VERSION_STAMP_TTL):
+            # another request created the stamp first.
+            version = cache.get(key) or version
+    return version
+
+def get_client_versions(username, client_names):
+    """
+    Returns a dict mapping each of client_names to the version stamp of its subscriptions, reading them
+    with a single cache call.
+    """
+    keys = dict((user_key('version', username, name), name) for name in client_names)
+    versions = dict((keys[key], version) for key, version in get_cache().get_many(keys.keys()).items())
+    for name in client_names:
+        if name not in versions:
+            versions[name] = get_version(username, name)
+    return versions
+
+def bump_version(username, *parts):
+    """
+    Gives a user's data (see get_version) a new version stamp.
+    """
+    get_cache().set(user_key('version', username, *parts), uuid.uuid4().hex, settings.VERSION_STAMP_TTL)
+
+def etag(version, *parts):
+    """
+    Strong ETag of a representation, identified by parts, of data at version.
+    """
+    value = '\0'.join(force_bytes(part) for part in [version] + list(parts))
+    return hashlib.md5(value).hexdigest()
+
+def _get_versioned(key, version):
+    entry = get_cache().get(key)
+    if entry is None or entry[0] != version:
+        return None
+    return entry[1]
+
+def get_applications(username, version=None):
+    """
+    Returns the cached, sanitized application listing of a user, or None on a miss. version is the
+    version stamp of the listing, when the caller has already read it.
+    """
+    return _get_versioned(user_key('applications', username), version or get_version(username))
+
+def set_applications(username, applications, version):
+    """
+    Caches the application listing of a user, read when the version stamp of the listing was version.
+    """
+    get_cache().set(user_key('applications', username), (version, applications),
+                    settings.APPLICATIONS_CACHE_TTL)
+    if settings.STALE_LISTINGS_TTL:
+        get_cache().set(user_key('stale_applications', username), applications, settings.STALE_LISTINGS_TTL)
+
+def get_stale_applications(username):
+    """
+    Returns the last application listing cached for a user, however old, or None. Only served while the
+    store is unavailable.
+    """
+    if not settings.STALE_LISTINGS_TTL:
+        return None
+    return get_cache().get(user_key('stale_applications', username))
+
+def invalidate_applications(username):
+    """
+    Drops the cached application listing of a user; called whenever the user's clients change.
+    """
+    get_cache().delete(user_key('applications', username))
+    bump_version(username)
+
+def get_subscriptions(username, client_name, version=None):
+    """
+    Returns the cached (undecorated) subscriptions of a user's client, or None on a miss. version is the
+    version stamp of the client's subscriptions, when the caller has already read it.
+    """
+    return _get_versioned(user_key('subscriptions', username, client_name),
+                          version or get_version(username, client_name))
+
+def set_subscriptions(username, subscriptions, versions):
+    """
+    Caches the subscriptions of several of a user's clients at once; subscriptions maps client name to the
+    list of subscriptions of that client, and versions maps client name to the version stamp of its
+    subscriptions when they were read.
+    """
+    get_cache().set_many(dict((user_key('subscriptions', username, client_name),
+                               (versions[client_name], subs))
+                              for client_name, subs in subscriptions.items()),
+                         settings.SUBSCRIPTIONS_CACHE_TTL)
+
+def invalidate_subscriptions(username, client_name):
+    """
+    Drops the cached subscriptions of one of a user's clients; does nothing if username is None.
+    """
+    if username:
+        get_cache().delete(user_key('subscriptions', username, client_name))
+        bump_version(username, client_name)
@@ -0,0 +1,120 @@
+'''
+The catalog of Agave APIs that clients are subscribed to. The catalog is loaded from the source selected
+by the API_CATALOG_SOURCE setting:
+ - 'settings' (the default): the core Agave APIs at AGAVE_API_VERSION plus ADDITIONAL_APIS.
+ - 'file': the JSON file API_CATALOG_FILE, holding either a list of APIs or an object mapping tenant hosts
+   (TENANT_HOST) to lists of APIs, with 'default' used for tenants that are not listed.
+ - 'store': the APIs published in the store, restricted to the providers in API_CATALOG_STORE_PROVIDERS.
+Every API is an object with a name, version and provider; entries are validated once as the catalog is
+loaded, and invalid ones are dropped.
+
+Each process keeps the catalog for API_CATALOG_REFRESH seconds before loading it again, so APIs can be
+added to a file or the store without restarting the service. If loading fails, the previous catalog is
+kept.
+'''
+
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from common.error import Error
+
+from agave_clients.service.store import get_store_client
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+CORE_APIS = ['Apps', 'Files', 'Jobs', 'Meta', 'Monitors', 'Notifications', 'Postits', 'Profiles', 'Systems',
+             'Transforms']
+
+
+def validate(apis, source):
+    """
+    Returns the valid APIs of a list loaded from source, as dicts with just their name, version and
+    provider, logging and dropping the others and any duplicates.
+    """
+    valid = []
+    seen = set()
+    for api in apis if isinstance(apis, list) else []:
+        if not isinstance(api, dict) or not all(isinstance(api.get(field), basestring) and api.get(field)
+                                                for field in ('name', 'version', 'provider')):
+            logger.error("Ignoring invalid API in the catalog from %s: %r", source, api)
+            continue
+        key = (api['name'], api['version'], api['provider'])
+        if key not in seen:
+            seen.add(key)
+            valid.append({'name': api['name'], 'version': api['version'], 'provider': api['provider']})
+    return valid
+
+def load_settings():
+    apis = [{'name': name, 'version': settings.AGAVE_API_VERSION, 'provider': 'admin'} for name in CORE_APIS]
+    return apis + list(settings.ADDITIONAL_APIS)
+
+def load_file():
+    with open(settings.API_CATALOG_FILE) as f:
+        catalog = json.load(f)
+    if isinstance(catalog, dict):
+        catalog = catalog.get(settings.TENANT_HOST, catalog.get('default'))
+    return catalog
+
+def load_store():
+    params = {'action': 'getAllPublishedAPIs'}
+    body = get_store_client().call('GET', settings.STORE_API_LIST_URL, "Unable to list the published APIs",
+                                   params=params, required='apis')
+    providers = settings.API_CATALOG_STORE_PROVIDERS
+    return [api for api in body['apis'] if not providers or api.get('provider') in providers]
+
+SOURCES = {'settings': load_settings,
+           'file': load_file,
+           'store': load_store}
+
+
+class Catalog(object):
+    """
+    The API catalog of a process, reloaded from its source at most every API_CATALOG_REFRESH seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.apis = None
+        self.loaded_at = 0
+
+    def load(self):
+        source = settings.API_CATALOG_SOURCE
+        if source not in SOURCES:
+            raise Error("Invalid API_CATALOG_SOURCE: " + str(source))
+        apis = validate(SOURCES[source](), source)
+        if not apis:
+            raise Error("The API catalog from " + source + " is empty.")
+        return apis
+
+    def get(self):
+        """
+        Returns the list of APIs in the catalog, reloading it first if it is due.
+        """
+        if self.apis is not None and time.time() - self.loaded_at < settings.API_CATALOG_REFRESH:
+            return self.apis
+        with self.lock:
+            if self.apis is None or time.time() - self.loaded_at >= settings.API_CATALOG_REFRESH:
+                try:
+                    self.apis = self.load()
+                except Exception as e:
+                    if self.apis is None:
+                        logger.error("Unable to load the API catalog, using the core APIs: %s", e)
+                        self.apis = validate(load_settings(), 'settings')
+                    else:
+                        logger.error("Unable to reload the API catalog, keeping the previous one: %s", e)
+                # don't retry a failed load on every request.
+                self.loaded_at = time.time()
+        return self.apis
+
+_catalog = Catalog()
+
+def get_apis():
+    """
+    Returns the APIs clients are subscribed to.
+    """
+    return _catalog.get()
@@ -0,0 +1,100 @@
+'''
+Management of the connections to the APIM db. Connections are kept open between requests for
+CONN_MAX_AGE seconds (APIM_DB_CONN_MAX_AGE by default) instead of being opened for every request to the
+remote MySQL server. A reused connection that has been idle for more than APIM_DB_PING_IDLE seconds is
+pinged before the request uses it, and replaced if the server has dropped it (e.g. after MySQL's
+wait_timeout). Connection churn is reported in the agave_clients_db_connections_total metric.
+
+Django opens connections per thread. The request signals take care of the request threads; long-lived
+worker threads call checkout() and checkin() around each unit of work, and short-lived ones call
+close_connections() before they exit.
+'''
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from agave_clients.service import metrics
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class ThreadState(threading.local):
+    def __init__(self):
+        # aliases of the connections this thread has open.
+        self.open = set()
+        # time at which each open connection was last released.
+        self.released = {}
+
+_state = ThreadState()
+
+
+def connection_created(sender, connection, **kwargs):
+    """
+    Handler of the connection_created signal.
+    """
+    _state.open.add(connection.alias)
+    metrics.record_db_connection('opened', connection.alias)
+
+def check_connections(**kwargs):
+    """
+    Handler of the request_started signal, run after Django has closed the connections that are past
+    their CONN_MAX_AGE. Pings the connections of this thread that have been idle for too long and closes
+    those that are no longer usable, so that the request opens a new one instead of failing.
+    """
+    now = time.time()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        idle = now - _state.released.get(connection.alias, now)
+        if settings.APIM_DB_PING_ON_CHECKOUT and idle > settings.APIM_DB_PING_IDLE:
+            if not connection.is_usable():
+                logger.info("Connection to db %s was dropped after %d seconds idle; reconnecting.",
+                            connection.alias, idle)
+                connection.close()
+                _state.open.discard(connection.alias)
+                metrics.record_db_connection('dropped', connection.alias)
+                continue
+        metrics.record_db_connection('reused', connection.alias)
+
+def release_connections(**kwargs):
+    """
+    Handler of the request_finished signal, run after Django has closed the connections that are past
+    their CONN_MAX_AGE. Records the connections that were closed and when the others were released.
+    """
+    now = time.time()
+    for connection in connections.all():
+        if connection.connection is not None:
+            _state.released[connection.alias] = now
+        elif connection.alias in _state.open:
+            _state.open.discard(connection.alias)
+            _state.released.pop(connection.alias, None)
+            metrics.record_db_connection('closed', connection.alias)
+
+def checkout():
+    """
+    Prepares the connections of a long-lived worker thread for a unit of work.
+    """
+    close_old_connections()
+    check_connections()
+
+def checkin():
+    """
+    Releases the connections of a long-lived worker thread after a unit of work, keeping them open for
+    the next one unless they are past their CONN_MAX_AGE.
+    """
+    close_old_connections()
+    release_connections()
+
+def close_connections():
+    """
+    Closes all of the connections of a thread that is about to exit.
+    """
+    for connection in connections.all():
+        connection.close()
+    release_connections()
@@ -0,0 +1,97 @@
+'''
+Bounded-concurrency execution for bulk store operations such as subscribing a client to all of the
+Agave APIs. Each operation is a blocking store call, so running them on a small pool of threads makes
+the latency of the whole batch close to that of the slowest call instead of the sum of all calls.
+'''
+
+from collections import namedtuple
+import logging
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+from common.error import Error
+
+from agave_clients.service import db, metrics
+from agave_clients.service.resilience import StoreUnavailable
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# The outcome of one operation in a fan-out: the item it was called with and either its return value or
+# the exception it raised.
+Result = namedtuple('Result', ['item', 'value', 'error'])
+
+
+def _call(func, item):
+    try:
+        return Result(item, func(item), None)
+    except Exception as e:
+        return Result(item, None, e)
+
+def _call_in_worker(func, item, timings):
+    # attribute the work to the request that started the fan-out.
+    metrics.set_current(timings)
+    try:
+        return _call(func, item)
+    finally:
+        metrics.set_current(None)
+        # worker threads get their own db connections; don't leave them open once the work is done.
+        db.close_connections()
+
+def fan_out(func, items, workers=None):
+    """
+    Calls func(item) for each item in items using at most `workers` threads (defaults to
+    STORE_FANOUT_WORKERS). Returns a list of Result objects in the order of items; exceptions raised by
+    func are captured in the Result instead of being raised.
+    """
+    items = list(items)
+    workers = min(workers or settings.STORE_FANOUT_WORKERS, len(items))
+    if workers <= 1:
+        return [_call(func, item) for item in items]
+    timings = metrics.current()
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(lambda item: _call_in_worker(func, item, timings), items)
+    finally:
+        pool.close()
+        pool.join()
+
+def fan_out_iter(func, items, workers=None):
+    """
+    Like fan_out, but yields the Result of each item as soon as it is available, in order of completion.
+    """
+    items = list(items)
+    workers = min(workers or settings.STORE_FANOUT_WORKERS, len(items))
+    if workers <= 1:
+        for item in items:
+            yield _call(func, item)
+        return
+    timings = metrics.current()
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap_unordered(lambda item: _call_in_worker(func, item, timings), items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def _reason(e):
+    return getattr(e, 'message', None) or str(e)
+
+def raise_for_failures(results, message, describe=str):
+    """
+    Raises a single Error listing every failed operation in results, if there were any. describe is used to
+    render the item of each failure in the message.
+    """
+    failures = [r for r in results if r.error]
+    if not failures:
+        return
+    for r in failures:
+        if isinstance(r.error, StoreUnavailable):
+            # the store is down; report that rather than the individual failures.
+            raise r.error
+    for r in failures:
+        logger.error(message + "; " + describe(r.item) + ": " + _reason(r.error))
+    raise Error(message + ": " + "; ".join(describe(r.item) + " (" + _reason(r.error) + ")" for r in failures))
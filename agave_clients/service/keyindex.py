@@ -0,0 +1,171 @@
+'''
+In-process index of the PRODUCTION consumer keys of APIM applications, by application id, so that
+listings don't query AM_APPLICATION_KEY_MAPPING on every request.
+
+The index is warmed with a single scan of the table the first time it is used in a process. A background
+thread then polls every KEY_INDEX_POLL_INTERVAL seconds for the mappings of applications created since,
+using the highest application id seen as a high-water mark and reading at most KEY_INDEX_BATCH_SIZE rows
+per query, and rescans the whole table every KEY_INDEX_RESYNC_INTERVAL seconds to pick up keys that were
+generated or regenerated for older applications. Keys obtained by this service are added directly.
+
+An application missing from the index is looked up in the db, so the index never hides a key that
+exists; it can only serve a key that was regenerated outside this service until the next rescan.
+'''
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from agave_clients.service import db, metrics
+from agave_clients.service.models import AmApplicationKeyMapping
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+KEY_TYPE = 'PRODUCTION'
+
+
+def query_keys(application_ids):
+    """
+    Returns a dict mapping the ids in application_ids to their consumer keys, with a single query.
+    """
+    mappings = AmApplicationKeyMapping.objects.filter(application_id__in=application_ids, key_type=KEY_TYPE)
+    with metrics.timed_db('application_key_mapping'):
+        return dict(mappings.values_list('application_id', 'consumer_key'))
+
+
+class KeyIndex(object):
+    """
+    The key index of a process; see the module documentation.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.high_water = 0
+        self.warmed_at = None
+        self.poller = None
+
+    def warm(self):
+        """
+        Loads all of the keys with one scan of the table, replacing the contents of the index.
+        """
+        mappings = AmApplicationKeyMapping.objects.filter(key_type=KEY_TYPE)
+        with metrics.timed_db('key_index_scan'):
+            keys = dict(mappings.values_list('application_id', 'consumer_key'))
+        with self.lock:
+            self.keys = keys
+            self.high_water = max(keys) if keys else 0
+            self.warmed_at = time.time()
+        logger.info("Key index loaded with %d keys.", len(keys))
+
+    def poll(self):
+        """
+        Adds the keys of the applications created since the last poll, in batches of KEY_INDEX_BATCH_SIZE.
+        """
+        while True:
+            mappings = AmApplicationKeyMapping.objects.filter(application_id__gt=self.high_water,
+                                                              key_type=KEY_TYPE).order_by('application_id')
+            with metrics.timed_db('key_index_poll'):
+                rows = list(mappings.values_list('application_id', 'consumer_key')
+                            [:settings.KEY_INDEX_BATCH_SIZE])
+            if rows:
+                with self.lock:
+                    self.keys.update(rows)
+                    self.high_water = max(self.high_water, rows[-1][0])
+            if len(rows) < settings.KEY_INDEX_BATCH_SIZE:
+                return
+
+    def run(self):
+        while True:
+            time.sleep(settings.KEY_INDEX_POLL_INTERVAL)
+            db.checkout()
+            try:
+                if time.time() - self.warmed_at >= settings.KEY_INDEX_RESYNC_INTERVAL:
+                    self.warm()
+                else:
+                    self.poll()
+            except Exception as e:
+                logger.error("Unable to refresh the key index: %s", e)
+            finally:
+                db.checkin()
+
+    def start(self):
+        """
+        Warms the index and starts the polling thread, unless that has been done already in this process.
+        """
+        if self.poller is not None:
+            return
+        with self.lock:
+            if self.poller is not None:
+                return
+            self.poller = threading.Thread(target=self.run, name='key-index-poller')
+            self.poller.daemon = True
+        try:
+            self.warm()
+        except Exception as e:
+            # lookups fall back to the db until the poller manages to rescan the table.
+            logger.error("Unable to load the key index: %s", e)
+            self.warmed_at = 0
+        self.poller.start()
+
+    def record(self, application_id, consumer_key):
+        """
+        Adds a key obtained by this service.
+        """
+        if application_id is not None and consumer_key:
+            with self.lock:
+                self.keys[application_id] = consumer_key
+
+    def get_keys(self, application_ids):
+        """
+        Returns a dict mapping application id to consumer key for the applications in application_ids that
+        have a key, looking up those missing from the index in the db.
+        """
+        self.start()
+        found = {}
+        missing = []
+        for application_id in application_ids:
+            consumer_key = self.keys.get(application_id)
+            if consumer_key:
+                found[application_id] = consumer_key
+            else:
+                missing.append(application_id)
+        metrics.record_key_index_lookups('hit', len(found))
+        if missing:
+            metrics.record_key_index_lookups('miss', len(missing))
+            keys = query_keys(missing)
+            with self.lock:
+                self.keys.update(keys)
+            found.update(keys)
+        return found
+
+_index = KeyIndex()
+
+
+def get_keys(application_ids):
+    """
+    Returns a dict mapping application id to consumer key for the applications in application_ids that
+    have a key.
+    """
+    if not application_ids:
+        return {}
+    if not settings.KEY_INDEX_ENABLED:
+        return query_keys(application_ids)
+    return _index.get_keys(application_ids)
+
+def start():
+    """
+    Loads the index and starts its polling thread ahead of the first lookup.
+    """
+    if settings.KEY_INDEX_ENABLED:
+        _index.start()
+
+def record_key(application_id, consumer_key):
+    """
+    Adds a key obtained by this service to the index.
+    """
+    if settings.KEY_INDEX_ENABLED:
+        _index.record(application_id, consumer_key)
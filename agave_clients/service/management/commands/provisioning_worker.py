@@ -0,0 +1,16 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from agave_clients.service import provisioning
+
+
+class Command(BaseCommand):
+    help = "Runs client provisioning jobs from the beanstalk queue (PROVISIONING_BACKEND = 'beanstalk')."
+    option_list = BaseCommand.option_list + (
+        make_option('--once', action='store_true', dest='once', default=False,
+                    help='Run a single job and exit.'),
+    )
+
+    def handle(self, *args, **options):
+        provisioning.work(once=options.get('once'))
@@ -0,0 +1,17 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from agave_clients.service import startup
+
+
+class Command(BaseCommand):
+    help = "Checks that the APIM store and db can be reached; exits with status 1 if either cannot."
+
+    def handle(self, *args, **options):
+        failed = False
+        for name, ok, detail in startup.self_check():
+            self.stdout.write("%s: %s (%s)" % (name, 'OK' if ok else 'FAILED', detail))
+            failed = failed or not ok
+        if failed:
+            sys.exit(1)
@@ -0,0 +1,308 @@
+'''
+Metrics for the clients service: counts and latency histograms of the store calls and db queries made
+by the views, and of the requests themselves, plus a per-request breakdown of where the time went that
+is reported in the Server-Timing response header (see agave_clients.service.middleware).
+
+Each process keeps its metrics in memory. When METRICS_DIR is set, every process periodically writes a
+snapshot of its metrics to a file in that directory and the exporter sums the snapshots of all processes,
+so that /clients/v2/_metrics reports the metrics of every mod_wsgi process whichever one serves it.
+The snapshots of processes that have exited are deleted as the metrics are exported, so the counters of
+recycled processes drop out of the totals (which Prometheus treats as a counter reset).
+'''
+
+from collections import defaultdict
+from contextlib import contextmanager
+import errno
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'agave_clients_store_calls_total': 'Calls made to the APIM store.',
+    'agave_clients_store_call_seconds': 'Latency of calls made to the APIM store.',
+    'agave_clients_store_circuit_transitions_total': 'Transitions of the store circuit breaker, by new state.',
+    'agave_clients_db_queries_total': 'Queries made to the APIM db.',
+    'agave_clients_db_query_seconds': 'Latency of queries made to the APIM db.',
+    'agave_clients_db_connections_total': 'Connections to the APIM db opened, reused, dropped and closed.',
+    'agave_clients_key_index_lookups_total': 'Consumer key lookups answered by the key index (hit) or the db (miss).',
+    'agave_clients_requests_total': 'Requests served.',
+    'agave_clients_request_seconds': 'Latency of requests served.',
+}
+
+
+class Registry(object):
+    """
+    The counters and histograms of one process. Metrics are identified by name and a tuple of label
+    (name, value) pairs.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                # one count per bucket, then the sum and the count of all observations.
+                histogram = self.histograms[(name, labels)] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': [[name, list(labels), value]
+                                 for (name, labels), value in self.counters.items()],
+                    'histograms': [[name, list(labels), list(values)]
+                                   for (name, labels), values in self.histograms.items()]}
+
+registry = Registry()
+
+
+def labels(**kwargs):
+    return tuple(sorted((k, str(v)) for k, v in kwargs.items()))
+
+
+# ----------------
+# Request timings
+# ----------------
+
+class RequestTimings(object):
+    """
+    Time spent in each kind of work (upstream, db, serialize) while serving one request.
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.view = 'unknown'
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, kind, seconds):
+        with self.lock:
+            self.durations[kind] += seconds
+            self.counts[kind] += 1
+
+    def header(self):
+        """
+        The value of the Server-Timing header for the request.
+        """
+        parts = ['%s;desc="%d calls";dur=%.1f' % (kind, self.counts[kind], self.durations[kind] * 1000)
+                 for kind in ('upstream', 'db') if kind in self.counts]
+        if 'serialize' in self.durations:
+            parts.append('serialize;dur=%.1f' % (self.durations['serialize'] * 1000))
+        parts.append('total;dur=%.1f' % ((time.time() - self.start) * 1000))
+        return ', '.join(parts)
+
+_local = threading.local()
+
+def current():
+    """
+    Returns the RequestTimings of the request being served by this thread, if any.
+    """
+    return getattr(_local, 'timings', None)
+
+def set_current(timings):
+    """
+    Makes timings the RequestTimings of this thread; used to attribute the work done by worker threads
+    to the request that started them.
+    """
+    _local.timings = timings
+
+def current_view():
+    timings = current()
+    return timings.view if timings else 'none'
+
+
+# ---------
+# Recording
+# ---------
+
+def record_store_call(endpoint, outcome, seconds):
+    metric_labels = labels(endpoint=endpoint, outcome=outcome, view=current_view())
+    registry.inc('agave_clients_store_calls_total', metric_labels)
+    registry.observe('agave_clients_store_call_seconds', metric_labels, seconds)
+    timings = current()
+    if timings:
+        timings.add('upstream', seconds)
+
+def record_circuit_transition(state):
+    registry.inc('agave_clients_store_circuit_transitions_total', labels(state=state))
+
+@contextmanager
+def timed_db(operation):
+    """
+    Context manager recording the ORM work done in its block as a db query named operation. Querysets are
+    lazy, so make sure they are evaluated inside the block.
+    """
+    start = time.time()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        seconds = time.time() - start
+        metric_labels = labels(operation=operation, outcome=outcome, view=current_view())
+        registry.inc('agave_clients_db_queries_total', metric_labels)
+        registry.observe('agave_clients_db_query_seconds', metric_labels, seconds)
+        timings = current()
+        if timings:
+            timings.add('db', seconds)
+
+def record_db_connection(event, alias):
+    registry.inc('agave_clients_db_connections_total', labels(event=event, db=alias))
+
+def record_key_index_lookups(outcome, count):
+    registry.inc('agave_clients_key_index_lookups_total', labels(outcome=outcome), count)
+
+def record_serialization(seconds):
+    timings = current()
+    if timings:
+        timings.add('serialize', seconds)
+
+def record_request(timings, method, status_code):
+    metric_labels = labels(view=timings.view, method=method, status=status_code)
+    registry.inc('agave_clients_requests_total', metric_labels)
+    registry.observe('agave_clients_request_seconds', metric_labels, time.time() - timings.start)
+    flush()
+
+
+# ----------
+# Exporting
+# ----------
+
+_last_flush = [0]
+
+def flush(force=False):
+    """
+    Writes this process's metrics to METRICS_DIR, at most once every METRICS_FLUSH_INTERVAL seconds unless
+    force is set. Does nothing when METRICS_DIR is not set.
+    """
+    if not settings.METRICS_DIR:
+        return
+    now = time.time()
+    if not force and now - _last_flush[0] < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush[0] = now
+    path = os.path.join(settings.METRICS_DIR, 'metrics_%d.json' % os.getpid())
+    try:
+        if not os.path.isdir(settings.METRICS_DIR):
+            os.makedirs(settings.METRICS_DIR)
+        tmp = path + '.tmp.%d' % threading.current_thread().ident
+        with open(tmp, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.rename(tmp, path)
+    except Exception as e:
+        logger.error("Unable to write metrics to " + path + ": " + str(e))
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM: the process exists but belongs to another user.
+        return e.errno == errno.EPERM
+    return True
+
+def prune(names):
+    """
+    Deletes the files of METRICS_DIR among names (snapshots and leftover temporary files) written by
+    processes that are no longer running; returns the names of the others.
+    """
+    kept = []
+    for name in names:
+        try:
+            pid = int(name[len('metrics_'):].split('.')[0])
+        except ValueError:
+            kept.append(name)
+            continue
+        if pid == os.getpid() or is_running(pid):
+            kept.append(name)
+            continue
+        try:
+            os.remove(os.path.join(settings.METRICS_DIR, name))
+        except OSError as e:
+            logger.error("Unable to delete metrics file " + name + ": " + str(e))
+    return kept
+
+def collect():
+    """
+    Returns the metrics of all processes (or of this process only when METRICS_DIR is not set) summed by
+    name and labels.
+    """
+    snapshots = []
+    if settings.METRICS_DIR:
+        flush(force=True)
+        names = prune([name for name in os.listdir(settings.METRICS_DIR) if name.startswith('metrics_')])
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                    snapshots.append(json.load(f))
+            except Exception as e:
+                logger.error("Unable to read metrics file " + name + ": " + str(e))
+    else:
+        snapshots.append(registry.snapshot())
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, metric_labels, value in snapshot['counters']:
+            counters[(name, tuple(tuple(l) for l in metric_labels))] += value
+        for name, metric_labels, values in snapshot['histograms']:
+            key = (name, tuple(tuple(l) for l in metric_labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+    return counters, histograms
+
+def _format_labels(metric_labels, extra=()):
+    pairs = list(metric_labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('%s="%s"' % (k, escape(v)) for k, v in pairs) + '}'
+
+def exposition():
+    """
+    Returns the metrics of all processes in the Prometheus text exposition format.
+    """
+    counters, histograms = collect()
+    lines = []
+    for name in sorted(set(name for name, _ in counters)):
+        lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+        lines.append('# TYPE %s counter' % name)
+        for (n, metric_labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append('%s%s %s' % (name, _format_labels(metric_labels), repr(value)))
+    for name in sorted(set(name for name, _ in histograms)):
+        lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+        lines.append('# TYPE %s histogram' % name)
+        for (n, metric_labels), values in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, values):
+                lines.append('%s_bucket%s %d' % (name, _format_labels(metric_labels, [('le', repr(bound))]), count))
+            lines.append('%s_bucket%s %d' % (name, _format_labels(metric_labels, [('le', '+Inf')]), values[-1]))
+            lines.append('%s_sum%s %s' % (name, _format_labels(metric_labels), repr(values[-2])))
+            lines.append('%s_count%s %d' % (name, _format_labels(metric_labels), values[-1]))
+    return '\n'.join(lines) + '\n'
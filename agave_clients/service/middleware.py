@@ -0,0 +1,29 @@
+'''
+Middleware for the clients service.
+'''
+
+from agave_clients.service import metrics
+
+
+class ServerTimingMiddleware(object):
+    """
+    Collects the time each request spends in store calls, db queries and serialization and reports it in
+    the Server-Timing response header. Should be the first middleware so that its timings cover the
+    whole request. Requests answered by an earlier middleware, such as CORS preflight requests, are not
+    timed or recorded.
+    """
+    def process_request(self, request):
+        metrics.set_current(metrics.RequestTimings())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = metrics.current()
+        if timings:
+            timings.view = getattr(view_func, '__name__', 'unknown')
+
+    def process_response(self, request, response):
+        timings = metrics.current()
+        if timings:
+            response['Server-Timing'] = timings.header()
+            metrics.record_request(timings, request.method, response.status_code)
+            metrics.set_current(None)
+        return response
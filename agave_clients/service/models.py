@@ -26,3 +26,24 @@ class AmApplicationKeyMapping(models.Model):
     class Meta:
         db_table = 'AM_APPLICATION_KEY_MAPPING'
         # managed = False
+
+class AmSubscriber(models.Model):
+    subscriber_id = models.IntegerField(primary_key=True, db_column='SUBSCRIBER_ID') # Field name made lowercase.
+    user_id = models.CharField(max_length=255L, db_column='USER_ID') # Field name made lowercase.
+    tenant_id = models.IntegerField(db_column='TENANT_ID') # Field name made lowercase.
+    class Meta:
+        db_table = 'AM_SUBSCRIBER'
+        # managed = False
+
+class AmApplication(models.Model):
+    application_id = models.IntegerField(primary_key=True, db_column='APPLICATION_ID') # Field name made lowercase.
+    name = models.CharField(max_length=100L, db_column='NAME', blank=True) # Field name made lowercase.
+    subscriber = models.ForeignKey(AmSubscriber, db_column='SUBSCRIBER_ID', null=True, blank=True) # Field name made lowercase.
+    application_tier = models.CharField(max_length=50L, db_column='APPLICATION_TIER', blank=True) # Field name made lowercase.
+    callback_url = models.CharField(max_length=512L, db_column='CALLBACK_URL', blank=True) # Field name made lowercase.
+    description = models.CharField(max_length=512L, db_column='DESCRIPTION', blank=True) # Field name made lowercase.
+    application_status = models.CharField(max_length=50L, db_column='APPLICATION_STATUS', blank=True) # Field name made lowercase.
+    group_id = models.CharField(max_length=100L, db_column='GROUP_ID', blank=True) # Field name made lowercase.
+    class Meta:
+        db_table = 'AM_APPLICATION'
+        # managed = False
@@ -0,0 +1,69 @@
+'''
+MySQL database engine drawing its connections from a process-wide pool per database; requires the
+SQLAlchemy package. To use it, set the ENGINE of the APIM db to 'agave_clients.service.mysql_pool' and its
+CONN_MAX_AGE to 0: closing the connection at the end of a request then returns it to the pool, and
+connections are pinged as they are checked out of it (APIM_DB_PING_ON_CHECKOUT).
+
+The size of the pools is set with the APIM_DB_POOL_* settings.
+'''
+
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base as mysql_base
+from django.utils import six
+from django.utils.safestring import SafeBytes, SafeText
+
+try:
+    from sqlalchemy import event, exc, pool
+except ImportError as e:
+    raise ImproperlyConfigured("The mysql_pool database engine requires the SQLAlchemy package: %s" % e)
+
+from agave_clients.service import metrics
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def ping(dbapi_connection, connection_record, connection_proxy):
+    """
+    Checks that a connection is alive as it is checked out of a pool; the pool replaces connections that
+    fail the check.
+    """
+    try:
+        dbapi_connection.ping()
+    except Exception:
+        raise exc.DisconnectionError()
+
+def get_pool(alias, conn_params):
+    """
+    Returns the pool of connections to the database alias, creating it on first use.
+    """
+    with _pools_lock:
+        if alias not in _pools:
+            connection_pool = pool.QueuePool(lambda: mysql_base.Database.connect(**conn_params),
+                                             pool_size=settings.APIM_DB_POOL_SIZE,
+                                             max_overflow=settings.APIM_DB_POOL_MAX_OVERFLOW,
+                                             timeout=settings.APIM_DB_POOL_TIMEOUT,
+                                             recycle=settings.APIM_DB_POOL_RECYCLE)
+            if settings.APIM_DB_PING_ON_CHECKOUT:
+                event.listen(connection_pool, 'checkout', ping)
+            event.listen(connection_pool, 'connect',
+                         lambda *args: metrics.record_db_connection('pool_connected', alias))
+            event.listen(connection_pool, 'close',
+                         lambda *args: metrics.record_db_connection('pool_disconnected', alias))
+            _pools[alias] = connection_pool
+    return _pools[alias]
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    """
+    The Django MySQL backend, with connections checked out of a pool. The pool's connection proxies
+    return the connection to the pool when Django closes them.
+    """
+    def get_new_connection(self, conn_params):
+        conn = get_pool(self.alias, conn_params).connect()
+        conn.encoders[SafeText] = conn.encoders[six.text_type]
+        conn.encoders[SafeBytes] = conn.encoders[bytes]
+        return conn
@@ -0,0 +1,110 @@
+'''
+Projections of the applications and subscriptions returned by WSO2 into the representations returned to
+the user. A projection holds the allowlist of fields shown to the user, renaming them where needed, and
+builds each representation as a new dict in a single pass. Hyperlinks are rendered from URL templates
+resolved from the URLconf once per process instead of calling reverse() for every item.
+'''
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils.http import urlquote
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class Projection(object):
+    """
+    Builds the representation of an item from an allowlist of (field, output field) pairs. Fields missing
+    from the item are left out of the representation.
+    """
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def __call__(self, item):
+        return dict((target, item[source]) for source, target in self.fields if source in item)
+
+application = Projection([('name', 'name'),
+                          ('consumerKey', 'consumerKey'),
+                          ('description', 'description'),
+                          ('tier', 'tier'),
+                          ('callbackUrl', 'callbackUrl'),
+                          ('_links', '_links')])
+
+subscription = Projection([('name', 'apiName'),
+                           ('status', 'apiStatus'),
+                           ('version', 'apiVersion'),
+                           ('context', 'apiContext'),
+                           ('provider', 'apiProvider'),
+                           ('tier', 'tier'),
+                           ('_links', '_links')])
+
+
+# --------------
+# URL templates
+# --------------
+
+# Stands in for the client name when resolving the routes of a client from the URLconf.
+PLACEHOLDER = 'AGAVE_CLIENTS_CLIENT_NAME'
+
+_templates = None
+_templates_lock = threading.Lock()
+
+def client_route(name):
+    """
+    Returns the (prefix, suffix) around the client name of the absolute URL of a route taking the client
+    name as its only argument.
+    """
+    prefix, suffix = reverse(name, args=[PLACEHOLDER]).split(PLACEHOLDER)
+    return settings.APP_BASE + prefix, suffix
+
+def templates():
+    """
+    Returns the URL templates of the hyperlinks, resolving them on first use (the URLconf imports the
+    views, so they cannot be resolved at import time).
+    """
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                _templates = {'clients': settings.APP_BASE + reverse('clients'),
+                              'client_details': client_route('client_details'),
+                              'client_subscriptions': client_route('client_subscriptions'),
+                              'client_provisioning': client_route('client_provisioning'),
+                              'profiles': settings.APP_BASE + '/profiles/' + settings.AGAVE_API_VERSION + '/'}
+    return _templates
+
+def provisioning_url(client_name):
+    """
+    The URL of the provisioning status of a client.
+    """
+    prefix, suffix = templates()['client_provisioning']
+    return prefix + urlquote(client_name) + suffix
+
+def application_links(client_name, username):
+    """
+    The references to self, subscriber and subscriptions of an application.
+    """
+    t = templates()
+    name = urlquote(client_name)
+    prefix, suffix = t['client_subscriptions']
+    return {'self': {'href': t['clients'] + name},
+            'subscriber': {'href': t['profiles'] + username},
+            'subscriptions': {'href': prefix + name + suffix}}
+
+def subscription_links(client_name):
+    """
+    Returns a function building the references to self, api and client of a subscription of the client.
+    The references to the client are the same for all of its subscriptions and are rendered only once.
+    """
+    t = templates()
+    name = urlquote(client_name)
+    subscriptions = t['client_subscriptions'][0] + name + t['client_subscriptions'][1]
+    details = t['client_details'][0] + name + t['client_details'][1]
+    return lambda sub: {'self': {'href': subscriptions},
+                        'api': {'href': settings.APP_BASE + sub.get('context') + '/'},
+                        'client': {'href': details}}
@@ -0,0 +1,239 @@
+'''
+Asynchronous client provisioning. Instead of running the whole creation pipeline (add the application,
+generate credentials, look the application up, subscribe it to the Agave APIs and fix its callback URL)
+in the request thread, a provisioning job is started and the progress of each step is reported by the
+provisioning resource of the client.
+
+Job state is kept in the Django cache named by CLIENTS_CACHE_ALIAS so that any process can report on a
+job. Jobs are run by one of two backends, selected with the PROVISIONING_BACKEND setting:
+ - 'thread' runs jobs on a pool of PROVISIONING_WORKERS threads in the process that accepted them.
+ - 'beanstalk' puts jobs on BEANSTALK_TUBE of the BEANSTALK_SERVER queue; they are run by the
+   provisioning_worker management command. Requires the beanstalkc package.
+'''
+
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+from django.conf import settings
+
+from common.error import Error
+
+from agave_clients.service import caches, db
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# The steps of the provisioning pipeline, in order.
+STEPS = ['add_application', 'generate_credentials', 'get_application', 'add_apis', 'update_callback_url']
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+COMPLETE = 'COMPLETE'
+FAILED = 'FAILED'
+# steps that a job didn't need, e.g. update_callback_url when no callbackUrl was given.
+SKIPPED = 'SKIPPED'
+
+
+def job_key(username, client_name):
+    return caches.user_key('provisioning', username, client_name)
+
+def secret_key(username, client_name):
+    return caches.user_key('provisioning_secret', username, client_name)
+
+def delivered_key(username, client_name):
+    return caches.user_key('provisioning_delivered', username, client_name)
+
+def new_job(username, client_name):
+    return {'clientName': client_name,
+            'owner': username,
+            'status': PENDING,
+            'created': time.time(),
+            'updated': time.time(),
+            'steps': [{'name': step, 'status': PENDING, 'message': None} for step in STEPS],
+            'result': None,
+            'message': None}
+
+def save_job(job):
+    job['updated'] = time.time()
+    caches.get_cache().set(job_key(job['owner'], job['clientName']), job, settings.PROVISIONING_JOB_TTL)
+
+def is_abandoned(job):
+    """
+    Whether a job that has not finished has made no progress for PROVISIONING_STALE_AFTER seconds, e.g.
+    because the process running it was recycled.
+    """
+    return (job.get('status') in (PENDING, RUNNING) and
+            time.time() - job.get('updated', job['created']) > settings.PROVISIONING_STALE_AFTER)
+
+def get_job(username, client_name):
+    """
+    Returns the provisioning job of a user's client, or None if there is none. Abandoned jobs are reported
+    as failed.
+    """
+    job = caches.get_cache().get(job_key(username, client_name))
+    if job and is_abandoned(job):
+        job['status'] = FAILED
+        job['message'] = "Provisioning was interrupted; create the client again."
+    return job
+
+def pop_secret(username, client_name):
+    """
+    Returns the consumer secret of a completed job the first time it is requested and None afterwards.
+    The add of the delivered marker is atomic in the shared cache, so only one request (in any process)
+    ever receives the secret.
+    """
+    cache = caches.get_cache()
+    secret = cache.get(secret_key(username, client_name))
+    if secret is None:
+        return None
+    if not cache.add(delivered_key(username, client_name), True, settings.PROVISIONING_JOB_TTL):
+        return None
+    cache.delete(secret_key(username, client_name))
+    return secret
+
+
+class JobTracker(object):
+    """
+    Records the progress of a job in the cache as the provisioning pipeline reports its steps.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.current = None
+
+    def _step(self, name):
+        for step in self.job['steps']:
+            if step['name'] == name:
+                return step
+
+    def __call__(self, name):
+        """
+        Marks the step currently running as complete and step name as running.
+        """
+        if self.current:
+            self._step(self.current)['status'] = COMPLETE
+        self.current = name
+        self._step(name)['status'] = RUNNING
+        self.job['status'] = RUNNING
+        save_job(self.job)
+
+    def complete(self, app, secret):
+        if self.current:
+            self._step(self.current)['status'] = COMPLETE
+        for step in self.job['steps']:
+            if step['status'] == PENDING:
+                step['status'] = SKIPPED
+        if secret is not None:
+            caches.get_cache().set(secret_key(self.job['owner'], self.job['clientName']), secret,
+                                   settings.PROVISIONING_JOB_TTL)
+        self.job['status'] = COMPLETE
+        self.job['result'] = app
+        save_job(self.job)
+
+    def fail(self, message):
+        if self.current:
+            step = self._step(self.current)
+            step['status'] = FAILED
+            step['message'] = message
+        self.job['status'] = FAILED
+        self.job['message'] = message
+        save_job(self.job)
+
+
+def run_job(job, cookies, params):
+    """
+    Runs the provisioning pipeline for a job. params are the keyword arguments of
+    create_client_application.
+    """
+    # imported here since the views import this module.
+    from agave_clients.service.views import create_client_application, sanitize_app
+    tracker = JobTracker(job)
+    username = job['owner']
+    try:
+        app = create_client_application(cookies, username, job['clientName'], progress=tracker, **params)
+        # the secret is kept apart from the job so that it can be delivered exactly once.
+        secret = app.get("consumerSecret")
+        tracker.complete(sanitize_app(app), secret)
+    except Error as e:
+        tracker.fail(e.message)
+    except Exception as e:
+        logger.error("Uncaught exception provisioning client " + job['clientName'] + ": " + str(e))
+        tracker.fail("Unable to provision client.")
+    finally:
+        caches.invalidate_applications(username)
+
+def _run_in_worker(job, cookies, params):
+    # the pool's threads live as long as the process, so their db connections are reused across jobs
+    # like those of the request threads.
+    db.checkout()
+    try:
+        run_job(job, cookies, params)
+    finally:
+        db.checkin()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Returns the process-wide pool of threads running provisioning jobs for the 'thread' backend.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPool(settings.PROVISIONING_WORKERS)
+    return _pool
+
+def get_beanstalk():
+    try:
+        import beanstalkc
+    except ImportError:
+        raise Error("The beanstalk provisioning backend requires the beanstalkc package.")
+    return beanstalkc.Connection(host=settings.BEANSTALK_SERVER, port=settings.BEANSTALK_PORT)
+
+def start_job(cookies, username, client_name, params):
+    """
+    Creates a provisioning job for a client and hands it to the configured backend. Returns the job.
+    Fails if the client already has a job in progress, unless that job has been abandoned.
+    """
+    job = new_job(username, client_name)
+    if not caches.get_cache().add(job_key(username, client_name), job, settings.PROVISIONING_JOB_TTL):
+        existing = get_job(username, client_name)
+        if existing and existing.get('status') in (PENDING, RUNNING):
+            raise Error("Client " + client_name + " is already being provisioned.")
+        save_job(job)
+    caches.get_cache().delete_many([secret_key(username, client_name), delivered_key(username, client_name)])
+    if settings.PROVISIONING_BACKEND == 'beanstalk':
+        queue = get_beanstalk()
+        try:
+            queue.use(settings.BEANSTALK_TUBE)
+            # the store session cookies are passed along; the worker cannot log in again on its own.
+            queue.put(json.dumps({'job': job, 'cookies': dict(cookies), 'params': params}))
+        finally:
+            queue.close()
+    else:
+        get_pool().apply_async(_run_in_worker, (job, cookies, params))
+    return job
+
+def work(once=False):
+    """
+    Runs jobs from the beanstalk queue; used by the provisioning_worker management command.
+    """
+    queue = get_beanstalk()
+    queue.watch(settings.BEANSTALK_TUBE)
+    while True:
+        entry = queue.reserve()
+        db.checkout()
+        try:
+            message = json.loads(entry.body)
+            run_job(message['job'], message['cookies'], message['params'])
+        finally:
+            db.checkin()
+            entry.delete()
+        if once:
+            break
@@ -0,0 +1,21 @@
+'''
+Renderers for the clients service.
+'''
+
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from agave_clients.service import metrics
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that records the time spent serializing each response for the Server-Timing header.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.time()
+        try:
+            return super(TimedJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.record_serialization(time.time() - start)
@@ -0,0 +1,113 @@
+'''
+Resilience of the service against failures of the APIM store. A circuit breaker, shared by all of the
+threads of a process, counts consecutive failed store calls (transport errors and 5xx responses). After
+STORE_BREAKER_THRESHOLD failures it opens: store calls then fail fast with StoreUnavailable, which the
+views report as a 503 with a Retry-After header, instead of tying up a thread until they time out. After
+STORE_BREAKER_RESET seconds a single trial call is let through; the circuit closes again if it succeeds
+and reopens if it fails.
+'''
+
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from common.error import Error
+from common.responses import error_dict
+
+from agave_clients.service import metrics
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class StoreUnavailable(Error):
+    """
+    Raised for store calls that are not made because the circuit is open. retry_after is the number of
+    seconds until the store will be tried again.
+    """
+    def __init__(self, message, retry_after):
+        super(StoreUnavailable, self).__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Thread-safe circuit breaker; see the module documentation.
+    """
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold or settings.STORE_BREAKER_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.STORE_BREAKER_RESET
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning("Store circuit breaker %s -> %s; %d consecutive failures.",
+                           self.state, state, self.failures)
+            metrics.record_circuit_transition(state)
+            self.state = state
+
+    def before_call(self):
+        """
+        Raises StoreUnavailable if no call should be made to the store right now.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            now = time.time()
+            if self.state == OPEN:
+                retry_after = self.opened_at + self.reset_timeout - now
+                if retry_after <= 0:
+                    # let this call through as the trial.
+                    self._transition(HALF_OPEN)
+                    self.trial_started = now
+                    return
+            else:
+                # a trial call is in flight; if it never reported back, let another one through.
+                if now - self.trial_started > self.reset_timeout:
+                    self.trial_started = now
+                    return
+                retry_after = 1
+        raise StoreUnavailable("The API store is unavailable; try again later.", retry_after)
+
+    def record_success(self):
+        with self.lock:
+            self._transition(CLOSED)
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.time()
+                self._transition(OPEN)
+
+
+def retry_delay(attempt):
+    """
+    Seconds to wait before retrying a store call for the attempt-th time (from 0): a random delay of up to
+    STORE_RETRY_BACKOFF seconds, doubled at every attempt.
+    """
+    return random.uniform(0, settings.STORE_RETRY_BACKOFF * (2 ** attempt))
+
+def unavailable_response(e):
+    """
+    The 503 response of a view that could not be served because the store is unavailable.
+    """
+    return Response(error_dict(msg=e.message), status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(int(math.ceil(max(e.retry_after, 1))))})
@@ -0,0 +1,81 @@
+'''
+Routing of the clients API, clients/v2[/{client_name}[/{resource}]]. Client names may contain slashes,
+which made the regular expressions matching them backtrack over the whole path for every pattern tried,
+and every pattern searched before the one that matched, anchored or not, costs a scan of the whole path.
+ClientResolver owns the clients/v2 prefix: it looks the fixed routes (the clients, _metrics and _batch)
+up in a dict and otherwise splits the last segment off the path once, so that a path is resolved with
+two regular expression searches that match at its start (the root's and the prefix's). Its patterns are
+only used to reverse URLs.
+'''
+
+import re
+
+from django.conf.urls import url
+from django.core.urlresolvers import RegexURLResolver, Resolver404, ResolverMatch
+
+
+# Format suffix of the fixed routes, as added by rest_framework's format_suffix_patterns.
+MAX_FORMAT_LENGTH = 16
+FORMAT_SUFFIX = re.compile(r'^[a-z0-9]{1,%d}$' % MAX_FORMAT_LENGTH)
+
+
+class ClientResolver(RegexURLResolver):
+    """
+    Resolver for the paths below the prefix of the clients API. fixed is a list of (path, view, name)
+    tuples for the routes that don't name a client, where path is the segment after the prefix ('' for
+    the prefix itself); these accept a trailing slash and a format suffix (.json). routes is a list of
+    (resource, view, name) tuples for the routes of a client, where resource is the last segment of the
+    path, or None for the client itself; these accept a trailing slash. name is the name the route is
+    reversed with.
+    """
+    def __init__(self, regex, fixed, routes):
+        self.fixed = {}
+        self.views = {}
+        patterns = []
+        for path, view, name in fixed:
+            self.fixed[path] = (view, name)
+            patterns.append(url(r'^/' + re.escape(path) + '$', view, name=name))
+        for resource, view, name in routes:
+            self.views[resource] = (view, name)
+            suffix = '/' + resource + '/' if resource else ''
+            patterns.append(url(r'^/(?P<client_name>.+)' + suffix + '$', view, name=name))
+        # segments longer than this can't name a route. They are not looked up, as hashing or searching a
+        # long client name would make resolution time grow with its length.
+        self.max_length = max(len(key or '') for key in self.fixed.keys() + self.views.keys()) + \
+            1 + MAX_FORMAT_LENGTH
+        super(ClientResolver, self).__init__(regex, patterns)
+
+    def resolve(self, path):
+        match = self.regex.search(path)
+        if not match:
+            raise Resolver404({'path': path})
+        rest = path[match.end():]
+        if rest.endswith('/'):
+            rest = rest[:-1]
+        if not rest.startswith('/'):
+            # the prefix itself, e.g. clients/v2 or clients/v2.json
+            return self.resolve_fixed(path, '', rest)
+        rest = rest[1:]
+        if len(rest) <= self.max_length:
+            if rest and rest in self.fixed:
+                return self.resolve_fixed(path, rest, '')
+            head, dot, extension = rest.rpartition('.')
+            if dot and head in self.fixed and FORMAT_SUFFIX.match(extension):
+                return self.resolve_fixed(path, head, dot + extension)
+        client_name, _, resource = rest.rpartition('/')
+        if not client_name or len(resource) > self.max_length or resource not in self.views:
+            client_name, resource = rest, None
+        if not client_name or client_name.endswith('/'):
+            raise Resolver404({'path': path})
+        view, name = self.views[resource]
+        return ResolverMatch(view, (), {'client_name': client_name}, name)
+
+    def resolve_fixed(self, path, fixed_path, suffix):
+        """
+        Resolves the fixed route at fixed_path, where suffix is empty or a format suffix such as '.json'.
+        """
+        if fixed_path not in self.fixed or suffix and not (suffix.startswith('.') and
+                                                           FORMAT_SUFFIX.match(suffix[1:])):
+            raise Resolver404({'path': path})
+        view, name = self.fixed[fixed_path]
+        return ResolverMatch(view, (), {'format': suffix[1:]} if suffix else {}, name)
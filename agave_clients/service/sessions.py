@@ -0,0 +1,171 @@
+'''
+Cache of WSO2 store login sessions. Logging in to the store (STORE_AUTH_URL) on every request doubles the
+store traffic, so the session cookies obtained at login are cached per set of credentials and reused
+until they expire or the store reports that the session is no longer valid.
+
+The cache backend is pluggable through the STORE_SESSION_BACKEND setting:
+ - LocalSessionBackend keeps sessions in process memory (TTL + LRU); suitable for development.
+ - DjangoCacheSessionBackend keeps sessions in a Django cache (e.g. memcached) so that they are shared by
+   all of the mod_wsgi processes.
+'''
+
+from collections import OrderedDict
+import hashlib
+import hmac
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+import requests
+
+from common.error import Error
+
+from agave_clients.service.resilience import StoreUnavailable
+from agave_clients.service.store import get_store_client
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class LocalSessionBackend(object):
+    """
+    In-process session cache with a TTL and LRU eviction once max_entries sessions are stored.
+    """
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl or settings.STORE_SESSION_TTL
+        self.max_entries = max_entries or settings.STORE_SESSION_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, cookies = entry
+            if expires < time.time():
+                return None
+            # re-insert to mark the entry as most recently used.
+            self._entries[key] = entry
+            return dict(cookies)
+
+    def set(self, key, cookies):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, dict(cookies))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DjangoCacheSessionBackend(object):
+    """
+    Session cache stored in the Django cache named by STORE_SESSION_CACHE_ALIAS. Eviction is left to the
+    cache itself (memcached evicts least recently used entries).
+    """
+    def __init__(self, ttl=None, alias=None):
+        self.ttl = ttl or settings.STORE_SESSION_TTL
+        self.cache = caches[alias or settings.STORE_SESSION_CACHE_ALIAS]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, cookies):
+        self.cache.set(key, dict(cookies), self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+class StoreCookies(dict):
+    """
+    The cookies of a store session. Passed as the cookies of store calls; when the store reports that the
+    session has expired, the store client calls refresh() to log in again and retries the call once.
+    """
+    def __init__(self, cookies, username, password):
+        super(StoreCookies, self).__init__(cookies)
+        self.username = username
+        self._password = password
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Discard the cached session and log in to the store again, updating these cookies in place. When
+        several threads sharing the cookies find the session expired at once, only the first logs in.
+        """
+        stale = dict(self)
+        with self._lock:
+            if dict(self) != stale:
+                # another thread refreshed the session while this one was waiting.
+                return
+            key = session_key(self.username, self._password)
+            get_backend().delete(key)
+            cookies = login(self.username, self._password)
+            get_backend().set(key, cookies)
+            # the new session cookies replace the old ones by name; the dict is never emptied so that calls
+            # running concurrently on other threads always see a complete set of cookies.
+            self.update(cookies)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Returns the process-wide session cache backend configured by STORE_SESSION_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.STORE_SESSION_BACKEND)()
+    return _backend
+
+def session_key(username, password):
+    """
+    Cache key for the session of a set of credentials. The credentials are hashed with the SECRET_KEY so
+    that the keys stored in a shared cache do not expose them.
+    """
+    digest = hmac.new(settings.SECRET_KEY,
+                      '\0'.join([settings.APIM_STORE_SERVICES_BASE_URL, username, password]),
+                      hashlib.sha256).hexdigest()
+    return 'agave_clients.session.' + digest
+
+def login(username, password):
+    """
+    Log in to the store and return the session cookies.
+    """
+    data = {'action': 'login', 'username': username, 'password': password}
+    try:
+        rsp = get_store_client().post(settings.STORE_AUTH_URL, data=data)
+    except StoreUnavailable:
+        raise
+    except Exception as e:
+        raise Error("Unable to log in to the API store; " + str(e))
+    if not rsp.status_code == 200:
+        raise Error("Unable to log in to the API store; status code: " + str(rsp.status_code))
+    try:
+        if rsp.json().get('error'):
+            raise Error("Invalid username/password combination.")
+    except ValueError:
+        raise Error("Unable to log in to the API store; no JSON received.")
+    return requests.utils.dict_from_cookiejar(rsp.cookies)
+
+def get_session(username, password):
+    """
+    Returns the StoreCookies for a set of credentials, logging in to the store only when no valid session
+    is cached.
+    """
+    key = session_key(username, password)
+    cookies = get_backend().get(key)
+    if cookies is None:
+        cookies = login(username, password)
+        get_backend().set(key, cookies)
+    return StoreCookies(cookies, username, password)
@@ -0,0 +1,124 @@
+'''
+Process start up. mod_wsgi preloads agave_clients/wsgi.py in each daemon process (WSGIImportScript in
+deployment/apache2.conf), which calls warm_up() so that the first requests served by a new process don't
+pay for importing the views, building the URLconf, opening connections to the store and the APIM db and
+loading the API catalog and key index. warm_up() also runs self_check() and logs whether the store and
+the db can be reached; the selfcheck management command runs the same checks for health probes.
+
+Before that, wsgi.py calls check_shared_state(), which stops a process from starting when several
+processes would each keep the listings, their invalidations and the provisioning jobs in a cache of their
+own.
+'''
+
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import get_resolver
+from django.db import connections
+
+from agave_clients.service import catalog, db, keyindex
+from agave_clients.service.store import get_store_client
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def check_store():
+    """
+    Checks that the store answers; any response other than a 5xx will do.
+    """
+    rsp = get_store_client().get(settings.STORE_AUTH_URL)
+    if rsp.status_code >= 500:
+        raise Exception("status code: " + str(rsp.status_code))
+    return settings.APIM_STORE_SERVICES_BASE_URL
+
+def check_dbs():
+    """
+    Checks that a query can be run on each of the configured dbs.
+    """
+    hosts = []
+    for connection in connections.all():
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        finally:
+            cursor.close()
+        hosts.append(connection.alias + ' (' + (connection.settings_dict.get('HOST') or 'local') + ')')
+    return ', '.join(hosts)
+
+CHECKS = [('store', check_store),
+          ('db', check_dbs)]
+
+def self_check():
+    """
+    Runs the start up checks. Returns a list of (name, ok, detail) tuples, where detail says what was
+    checked or why the check failed.
+    """
+    results = []
+    for name, check in CHECKS:
+        try:
+            results.append((name, True, check()))
+        except Exception as e:
+            results.append((name, False, str(e)))
+    return results
+
+def process_count():
+    """
+    Number of daemon processes serving the service: mod_wsgi's maximum_processes (mod_wsgi 4 and later),
+    otherwise the WSGI_PROCESSES environment variable deployment/apache2.conf is configured with.
+    """
+    try:
+        import mod_wsgi
+        return int(mod_wsgi.maximum_processes)
+    except (ImportError, AttributeError):
+        return int(os.environ.get('WSGI_PROCESSES') or 1)
+
+def check_shared_state():
+    """
+    Raises ImproperlyConfigured when more than one process serves the service and the cache named by
+    CLIENTS_CACHE_ALIAS is local to each process: a process would go on serving listings another process
+    has invalidated, and couldn't report on the provisioning jobs of the others. Logs a warning when the
+    processes don't share a METRICS_DIR, as /clients/v2/_metrics then only reports one of them.
+    """
+    processes = process_count()
+    if processes <= 1:
+        return
+    if isinstance(caches[settings.CLIENTS_CACHE_ALIAS], LocMemCache):
+        raise ImproperlyConfigured("The service runs in " + str(processes) + " processes but the '" +
+                                   settings.CLIENTS_CACHE_ALIAS + "' cache is local to each process. "
+                                   "Configure a shared cache such as memcached (MEMCACHED_LOCATION) "
+                                   "or run a single process (WSGI_PROCESSES=1).")
+    if not settings.METRICS_DIR:
+        logger.warning("The service runs in %d processes without a METRICS_DIR; the metrics endpoint "
+                       "only reports the process serving the request.", processes)
+
+def warm_up():
+    """
+    Loads everything a request needs ahead of the first request, then runs the self check. Failures are
+    logged and never prevent the process from starting; the work is then done by the first requests.
+    """
+    start = time.time()
+    try:
+        # importing the URLconf imports the views and everything they depend on.
+        get_resolver(None).url_patterns
+        get_store_client()
+        if settings.STARTUP_SELF_CHECK:
+            for name, ok, detail in self_check():
+                if ok:
+                    logger.info("Start up check of the %s passed: %s", name, detail)
+                else:
+                    logger.error("Start up check of the %s FAILED: %s", name, detail)
+        catalog.get_apis()
+        keyindex.start()
+    except Exception as e:
+        logger.error("Unable to warm up the process: %s", e)
+    finally:
+        # this thread never serves requests, so its connections would only be held open.
+        db.close_connections()
+    logger.info("Process warmed up in %.2f seconds.", time.time() - start)
@@ -0,0 +1,232 @@
+'''
+HTTP client for the WSO2 APIM store. All calls to APIM_STORE_SERVICES_BASE_URL should go through the
+process-wide client returned by get_store_client() so that connections to the store are pooled and
+kept alive instead of paying a TCP+TLS handshake on every call.
+'''
+
+import cookielib
+import logging
+import threading
+import time
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.error import Error
+
+from agave_clients.service import metrics
+from agave_clients.service.resilience import CircuitBreaker, StoreUnavailable, retry_delay
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class NoCookiesPolicy(cookielib.DefaultCookiePolicy):
+    """
+    Cookie policy that never stores cookies on the shared session. The store session cookies belong to
+    the individual users and are passed explicitly on each call; they must never leak from one user's
+    call into another's through the shared session's cookie jar.
+    """
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class StoreClient(object):
+    """
+    Thread-safe client for the APIM store services with keep-alive connection pooling, per-call
+    timeouts, retries of idempotent calls and a circuit breaker (see agave_clients.service.resilience).
+    """
+    def __init__(self, base_url=None, pool_connections=None, pool_maxsize=None, timeouts=None,
+                 verify=None):
+        self.base_url = base_url or settings.APIM_STORE_SERVICES_BASE_URL
+        self.default_timeout = (settings.STORE_CONNECT_TIMEOUT, settings.STORE_READ_TIMEOUT)
+        self.timeouts = timeouts if timeouts is not None else settings.STORE_TIMEOUTS
+        self.verify = settings.STORE_VERIFY_SSL if verify is None else verify
+        self.session = requests.Session()
+        self.session.cookies.set_policy(NoCookiesPolicy())
+        adapter = HTTPAdapter(pool_connections=pool_connections or settings.STORE_POOL_CONNECTIONS,
+                              pool_maxsize=pool_maxsize or settings.STORE_POOL_MAXSIZE,
+                              pool_block=settings.STORE_POOL_BLOCK)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker()
+
+    def close(self):
+        """
+        Closes the pooled connections to the store.
+        """
+        self.session.close()
+
+    def timeout(self, path):
+        """
+        Returns the (connect, read) timeout for calls to the store endpoint at path.
+        """
+        return self.timeouts.get(path, self.default_timeout)
+
+    def request(self, method, path, cookies=None, **kwargs):
+        """
+        Make a call to the store endpoint at path, relative to the store services base URL. If cookies is a
+        refreshable store session (see agave_clients.service.sessions) and the store reports that the
+        session has expired, the session is refreshed and the call retried once.
+        """
+        kwargs.setdefault('timeout', self.timeout(path))
+        kwargs.setdefault('verify', self.verify)
+        rsp = self.send_with_retries(method, path, cookies, kwargs)
+        refresh = getattr(cookies, 'refresh', None)
+        if refresh and session_expired(rsp):
+            logger.info("Store session expired; logging in again.")
+            refresh()
+            rsp = self.send_with_retries(method, path, cookies, kwargs)
+        return rsp
+
+    def send_with_retries(self, method, path, cookies, kwargs):
+        """
+        Make a call to the store. GETs are idempotent and are retried up to STORE_RETRIES times, after a
+        jittered backoff, when they fail with a transport error or one of the STORE_RETRY_STATUSES.
+        """
+        attempts = 1 + (settings.STORE_RETRIES if method == 'GET' else 0)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                rsp = self.send(method, path, cookies, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise
+                logger.info("Retrying store call to %s after error: %s", endpoint_name(path), e)
+            else:
+                if last or rsp.status_code not in settings.STORE_RETRY_STATUSES:
+                    return rsp
+                logger.info("Retrying store call to %s after status %s", endpoint_name(path), rsp.status_code)
+            time.sleep(retry_delay(attempt))
+
+    def send(self, method, path, cookies, kwargs):
+        """
+        Make a single call to the store, unless the circuit breaker is open, recording its latency and
+        outcome in the metrics and its success or failure in the circuit breaker.
+        """
+        try:
+            self.breaker.before_call()
+        except StoreUnavailable:
+            metrics.record_store_call(endpoint_name(path), 'circuit_open', 0)
+            raise
+        start = time.time()
+        outcome = 'error'
+        try:
+            rsp = self.session.request(method, self.base_url + path, cookies=cookies, **kwargs)
+            outcome = 'ok' if rsp.status_code == 200 else 'http_' + str(rsp.status_code)
+            return rsp
+        except requests.Timeout:
+            outcome = 'timeout'
+            raise
+        finally:
+            metrics.record_store_call(endpoint_name(path), outcome, time.time() - start)
+            if outcome in ('error', 'timeout') or outcome.startswith('http_5'):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def get(self, path, cookies=None, **kwargs):
+        return self.request('GET', path, cookies=cookies, **kwargs)
+
+    def post(self, path, cookies=None, **kwargs):
+        return self.request('POST', path, cookies=cookies, **kwargs)
+
+    def call(self, method, path, failure, cookies=None, required=None, accept=(), **kwargs):
+        """
+        Make a call to the store and validate the response in one pass, decoding its body only once.
+        Returns the decoded body. Raises an Error, with a message starting with failure, if the call cannot
+        be made, the status code is not 200, the body is not a JSON object, the store reports an error or
+        the body has no (or an empty) required field. A body whose message contains one of the accept
+        strings is returned as is without further checks.
+        """
+        try:
+            rsp = self.request(method, path, cookies=cookies, **kwargs)
+        except StoreUnavailable:
+            raise
+        except Exception as e:
+            raise Error(failure + "; message: " + str(e))
+        if settings.STORE_DEBUG_PAYLOADS:
+            logger.debug("Store %s %s: status %s, request %s, response %s",
+                         method, endpoint_name(path), rsp.status_code, kwargs.get('data') or kwargs.get('params'),
+                         rsp.content)
+        try:
+            body = decode(rsp)
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            if rsp.status_code != 200:
+                raise Error(failure + "; status code: " + str(rsp.status_code))
+            raise Error(failure + "; no JSON received.")
+        message = body.get('message')
+        if message and any(a in message for a in accept):
+            return body
+        if rsp.status_code != 200:
+            raise Error(failure + "; status code: " + str(rsp.status_code))
+        if body.get('error'):
+            raise Error(failure + "; error: " + str(message or body.get('error')))
+        if required and not body.get(required):
+            raise Error(failure + "; no " + required + " in the response.")
+        return body
+
+
+# Settings holding the paths of the store endpoints; used to label the metrics of store calls.
+ENDPOINT_SETTINGS = ['STORE_AUTH_URL', 'STORE_SUBSCRIPTION_URL', 'STORE_REMOVE_SUB_URL', 'STORE_LIST_SUBS_URL',
+                     'STORE_APPS_URL', 'STORE_ADD_APP_URL', 'STORE_REMOVE_APP_URL', 'STORE_API_LIST_URL']
+
+def endpoint_name(path):
+    """
+    Returns the name of the setting holding the store endpoint path, or the path itself.
+    """
+    for name in ENDPOINT_SETTINGS:
+        if getattr(settings, name, None) == path:
+            return name
+    return path
+
+def decode(rsp):
+    """
+    Returns the decoded JSON body of a store response. The body is decoded on first use only and kept on
+    the response. Raises ValueError if the body is not JSON.
+    """
+    try:
+        return rsp._store_body
+    except AttributeError:
+        rsp._store_body = rsp.json()
+        return rsp._store_body
+
+def session_expired(rsp):
+    """
+    Whether a store response reports that the session used for the call is no longer valid.
+    """
+    if rsp.status_code == 401:
+        return True
+    # session errors are short JSON messages; don't decode large payloads just to check.
+    if rsp.status_code != 200 or len(rsp.content) > 1024:
+        return False
+    try:
+        body = decode(rsp)
+    except ValueError:
+        return False
+    if not isinstance(body, dict) or not body.get('error'):
+        return False
+    message = str(body.get('message', '')).lower()
+    return any(marker in message for marker in settings.STORE_SESSION_EXPIRED_MARKERS)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_store_client():
+    """
+    Returns the process-wide StoreClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = StoreClient()
+    return _client
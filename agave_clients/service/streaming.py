@@ -0,0 +1,47 @@
+'''
+Streaming JSON responses. Large results are written to the client one item at a time, wrapped in the
+usual response envelope, instead of being built and serialized in one piece.
+'''
+
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def stream_envelope(envelope, items):
+    """
+    Yields the JSON of a response envelope (as returned by success_dict) in chunks, with its result
+    replaced by the array of items. Each item is serialized as it is produced by the items iterable.
+
+    The status of the response has been sent by the time the items are produced, so callers should do any
+    work that can fail before streaming. If producing an item fails anyway, the document is still closed,
+    with the items produced so far and an "error" field saying that the result is incomplete.
+    """
+    head = dict(envelope)
+    head.pop('result', None)
+    opening = json.dumps(head)[:-1]
+    yield opening + (', ' if head else '') + '"result": ['
+    try:
+        for i, item in enumerate(items):
+            yield (', ' if i else '') + json.dumps(item)
+    except Exception as e:
+        logger.error("Uncaught exception streaming a response: %s", e)
+        yield '], "error": ' + json.dumps("The result is incomplete: " + str(e)) + '}'
+        return
+    yield ']}'
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    A response streaming a response envelope whose result is the array of items; see stream_envelope.
+    """
+    def __init__(self, envelope, items, status=200, headers=None):
+        super(StreamingJSONResponse, self).__init__(stream_envelope(envelope, items), status=status,
+                                                    content_type='application/json')
+        for name, value in (headers or {}).items():
+            self[name] = value
@@ -4,40 +4,49 @@ management of APIM clients through a RESTful web interface.
 '''
 
 import logging
-import urllib
+import time
 
 from django.conf import settings
-from django.core.urlresolvers import reverse
-from django.db import transaction
+from django.core.urlresolvers import NoReverseMatch, Resolver404, resolve, reverse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag, urlunquote
 
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-import requests
 
-from common import auth
 from common.error import Error
 from common.responses import error_dict, success_dict, error_response, success_response
 
-from agave_clients.service.models import IdnOauthConsumerApps, AmApplicationKeyMapping
+from agave_clients.service import auth, caches, catalog, keyindex, metrics, projections, provisioning
+from agave_clients.service.fanout import fan_out, fan_out_iter, raise_for_failures
+from agave_clients.service.models import IdnOauthConsumerApps, AmApplication
+from agave_clients.service.resilience import StoreUnavailable, unavailable_response
+from agave_clients.service.store import get_store_client
+from agave_clients.service.streaming import StreamingJSONResponse
 
 
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-AGAVE_APIS = [{'name':'Apps', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Files', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Jobs', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Meta', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Monitors', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Notifications', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Postits', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Profiles', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Systems', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},
-            {'name':'Transforms', 'version':settings.AGAVE_API_VERSION, 'provider':'admin'},]
+# Response header reporting whether a listing was served from the cache.
+CACHE_HEADER = 'X-Cache'
 
-AGAVE_APIS.extend(settings.ADDITIONAL_APIS)
+class Metrics(APIView):
+    def perform_authentication(self, request):
+        pass
+
+    def get(self, request, format=None):
+        """
+        Metrics of the store calls, db queries and requests of all processes, in the Prometheus text format.
+        Only served to the addresses in METRICS_ALLOWED_ADDRESSES.
+        """
+        allowed = settings.METRICS_ALLOWED_ADDRESSES
+        if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+            return Response(error_dict(msg="Metrics are not available from this address."),
+                            status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class Clients(APIView):
 
@@ -50,15 +59,38 @@ class Clients(APIView):
         List all client applications for a user.
         username -- (REQUIRED)
         password -- (REQUIRED)
+        offset -- Number of clients to skip.
+        limit -- Maximum number of clients to return.
+        stream -- Send stream=true to have the clients streamed back as they are retrieved.
         """
         try:
-            applications = get_applications(request.wso2_cookies, request.wso2_username,)
+            offset, limit = get_page(request)
+            stream = is_streaming(request)
+            version = caches.get_version(request.wso2_username)
+            etag = caches.etag(version, 'clients', offset, limit, stream)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            applications, hit = get_applications_cached(request.wso2_cookies, request.wso2_username,
+                                                        offset=offset, limit=limit, lazy=stream, version=version)
+        except StoreUnavailable as e:
+            # serve the last listing known, if any, while the store is down.
+            applications = caches.get_stale_applications(request.wso2_username)
+            if applications is None:
+                return unavailable_response(e)
+            return Response(success_dict(msg="Clients retrieved successfully.",
+                                         result=paginate(applications, offset, limit)),
+                            headers={CACHE_HEADER: 'STALE', 'Warning': '110 - "Response is Stale"'})
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Uncaught exception trying to retrieve clients: " + str(e))
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
-        return Response(success_dict(msg="Clients retrieved successfully.", result=applications))
+        headers = {CACHE_HEADER: 'HIT' if hit else 'MISS', 'ETag': quote_etag(etag)}
+        if stream:
+            return StreamingJSONResponse(success_dict(msg="Clients retrieved successfully.", result=None),
+                                         applications, headers=headers)
+        return Response(success_dict(msg="Clients retrieved successfully.", result=applications),
+                        headers=headers)
 
     @auth.authenticated
     def post(self, request, format=None):
@@ -70,6 +102,8 @@ class Clients(APIView):
         description -- Description of the application
         callbackUrl -- Callback URL for OAuth authorization grant flow.
         """
+        if is_async(request):
+            return self.post_async(request)
         parms = ['clientName']
         try:
             parm_values = get_parms_from_request(request.DATA, parms)
@@ -79,23 +113,75 @@ class Clients(APIView):
                                                     tier=request.DATA.get('tier', settings.DEFAULT_TIER),
                                                     description=request.DATA.get('description',''),
                                                     callbackUrl=request.DATA.get('callbackUrl', ''))
-            logger.info("Application created, id:" + str(application.get('application_id')))
+            logger.info("Application created, id: %s", application.get('application_id'))
             # add_apis(request.wso2_cookies, application.get('id'))
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Uncaught exception trying to create a new client: " + str(e))
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        finally:
+            caches.invalidate_applications(request.wso2_username)
 
-        # we need to sanitize the application, but sanitize will remove the consumerSecret, which in
-        # this one case we actually want to send back to the user:
-        secret = application.pop("consumerSecret", None)
-        sanitize_app(application)
-        application['consumerSecret'] = secret
         return Response(success_dict(msg="Client created successfully.",
-                                     result=application),
+                                     result=present_new_app(application)),
                         status=status.HTTP_201_CREATED)
 
+    def post_async(self, request):
+        """
+        Start provisioning a new client in the background; the progress is reported by the provisioning
+        resource of the client.
+        """
+        parms = ['clientName']
+        try:
+            parm_values = get_parms_from_request(request.DATA, parms)
+            validate_client_name(parm_values['clientName'])
+            params = {'tier': validate_tier(request.DATA.get('tier', settings.DEFAULT_TIER)),
+                      'description': request.DATA.get('description', ''),
+                      'callbackUrl': request.DATA.get('callbackUrl', '')}
+            job = provisioning.start_job(request.wso2_cookies, request.wso2_username,
+                                         parm_values['clientName'], params)
+        except Error as e:
+            return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error("Uncaught exception trying to start provisioning a new client: " + str(e))
+            return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        return Response(success_dict(msg="Client provisioning started.", result=job),
+                        status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': projections.provisioning_url(parm_values['clientName'])})
+
+class ClientBatch(APIView):
+    def perform_authentication(self, request):
+        pass
+
+    @auth.authenticated
+    def post(self, request, format=None):
+        """
+        Create and delete many clients at once. The result of each client is streamed back as soon as it
+        is done; created clients include their consumerSecret.
+
+        create -- List of clients to create: objects with the clientName, tier, description and callbackUrl
+                  of a client, or just client names.
+        delete -- List of names of clients to delete.
+        """
+        try:
+            operations = get_batch_operations(request.DATA)
+            # one listing serves the whole batch.
+            existing = set(app.get("name") for app in fetch_applications(request.wso2_cookies))
+        except StoreUnavailable as e:
+            return unavailable_response(e)
+        except Error as e:
+            return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error("Uncaught exception trying to start a batch: " + str(e))
+            return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        return StreamingJSONResponse(success_dict(msg="Batch processed; see the status of each client.",
+                                                  result=None),
+                                     run_batch(request.wso2_cookies, request.wso2_username, operations,
+                                               existing))
+
 class ClientDetails(APIView):
     def perform_authentication(self, request):
         pass
@@ -106,12 +192,16 @@ class ClientDetails(APIView):
         Remove a client.
         """
         try:
-            delete_client(request.wso2_cookies, client_name)
+            delete_client(request.wso2_cookies, client_name, username=request.wso2_username)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Uncaught exception trying to remove client: " + str(e))
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
+        finally:
+            caches.invalidate_applications(request.wso2_username)
 
         return Response(success_dict(msg="Client removed successfully."))
 
@@ -121,13 +211,48 @@ class ClientDetails(APIView):
         Retrieve details for a client.
         """
         try:
-            app = get_application(request.wso2_cookies, request.wso2_username, client_name)
+            version = caches.get_version(request.wso2_username)
+            etag = caches.etag(version, 'client', client_name)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            app = get_cached_application(request.wso2_username, client_name, version=version)
+            hit = app is not None
+            if not hit:
+                app = get_application(request.wso2_cookies, request.wso2_username, client_name)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Uncaught exception trying to retrieve client details: " + str(e))
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
-        return Response(success_dict(msg="Client details retrieved successfully.", result=app))
+        return Response(success_dict(msg="Client details retrieved successfully.", result=app),
+                        headers={CACHE_HEADER: 'HIT' if hit else 'MISS', 'ETag': quote_etag(etag)})
+
+class ClientProvisioning(APIView):
+    def perform_authentication(self, request):
+        pass
+
+    @auth.authenticated
+    def get(self, request, client_name, format=None):
+        """
+        Retrieve the status of the provisioning job of a client. Once the job is complete, the consumerSecret
+        of the client is included in the first response only.
+        """
+        try:
+            job = provisioning.get_job(request.wso2_username, client_name)
+            if job and job.get('status') == provisioning.COMPLETE:
+                secret = provisioning.pop_secret(request.wso2_username, client_name)
+                if secret is not None:
+                    job['result']['consumerSecret'] = secret
+        except Exception as e:
+            logger.error("Uncaught exception trying to retrieve provisioning status: " + str(e))
+            return Response(error_dict(msg="Unable to retrieve provisioning status."),
+                            status.HTTP_400_BAD_REQUEST)
+        if not job:
+            return Response(error_dict(msg="No provisioning job found for client " + client_name + "."),
+                            status.HTTP_404_NOT_FOUND)
+        return Response(success_dict(msg="Provisioning status retrieved successfully.", result=job))
 
 class ClientSubscriptions(APIView):
     def perform_authentication(self, request):
@@ -137,16 +262,34 @@ class ClientSubscriptions(APIView):
     def get(self, request, client_name, format=None):
         """
         Retrieve subscriptions for a client.
+        offset -- Number of subscriptions to skip.
+        limit -- Maximum number of subscriptions to return.
+        stream -- Send stream=true to have the subscriptions streamed back as they are retrieved.
         """
         try:
-            subscriptions = get_subscriptions(request.wso2_cookies, client_name)
+            offset, limit = get_page(request)
+            stream = is_streaming(request)
+            version = caches.get_version(request.wso2_username, client_name)
+            etag = caches.etag(version, 'subscriptions', client_name, offset, limit, stream)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            subscriptions = get_subscriptions(request.wso2_cookies, client_name, username=request.wso2_username,
+                                              offset=offset, limit=limit, lazy=stream, version=version)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Unhandled exception in ClientSubscription: " + str(e))
             return Response(error_dict(msg="Unable to retrieve subscriptions."),
                             status.HTTP_400_BAD_REQUEST)
-        return Response(success_dict(msg="Client subscriptions retrieved successfully.", result=subscriptions))
+        headers = {'ETag': quote_etag(etag)}
+        if stream and subscriptions is not None:
+            return StreamingJSONResponse(success_dict(msg="Client subscriptions retrieved successfully.",
+                                                      result=None),
+                                         subscriptions, headers=headers)
+        return Response(success_dict(msg="Client subscriptions retrieved successfully.", result=subscriptions),
+                        headers=headers)
 
     @auth.authenticated
     def post(self, request, client_name, format=None):
@@ -163,20 +306,26 @@ class ClientSubscriptions(APIView):
         try:
             parm_values = get_parms_from_request(request.DATA, parms)
             if parm_values['apiName'] == '*':
-                add_apis(request.wso2_cookies, client_name, tier=request.DATA.get('tier', settings.DEFAULT_TIER))
+                add_apis(request.wso2_cookies, client_name, tier=request.DATA.get('tier', settings.DEFAULT_TIER),
+                         username=request.wso2_username)
             else:
                 add_api(request.wso2_cookies,
                         client_name,
                         parm_values['apiName'],
                         request.DATA.get('apiVersion'),
                         request.DATA.get('apiProvider'),
-                        request.DATA.get('tier', settings.DEFAULT_TIER))
+                        request.DATA.get('tier', settings.DEFAULT_TIER),
+                        username=request.wso2_username)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Unhandled exception in ClientSubscription: " + str(e))
             return Response(error_dict(msg="Unable to subscribe client to Agave APIs."),
                             status.HTTP_400_BAD_REQUEST)
+        finally:
+            caches.invalidate_applications(request.wso2_username)
         if parm_values['apiName'] == '*':
             return Response(success_dict(msg="Client " + client_name + " has been subscribed to Agave APIs."))
         else:
@@ -195,19 +344,24 @@ class ClientSubscriptions(APIView):
         try:
             parm_values = get_parms_from_request(request.DATA, parms)
             if parm_values['apiName'] == '*':
-                remove_apis(request.wso2_cookies, client_name)
+                remove_apis(request.wso2_cookies, client_name, username=request.wso2_username)
             else:
                 remove_api(request.wso2_cookies,
                         client_name,
                         parm_values['apiName'],
                         request.DATA.get('apiVersion'),
-                        request.DATA.get('apiProvider'))
+                        request.DATA.get('apiProvider'),
+                        username=request.wso2_username)
+        except StoreUnavailable as e:
+            return unavailable_response(e)
         except Error as e:
             return Response(error_dict(msg=e.message), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error("Unhandled exception in ClientSubscription: " + str(e))
             return Response(error_dict(msg="Unable to remove API from client."),
                             status.HTTP_400_BAD_REQUEST)
+        finally:
+            caches.invalidate_applications(request.wso2_username)
         if parm_values['apiName'] == '*':
             return Response(success_dict(msg="All APIs have been removed from the client "
                                              + client_name + "."))
@@ -216,6 +370,62 @@ class ClientSubscriptions(APIView):
                                              client_name + "."))
 
 
+def is_async(request):
+    """
+    Whether a request asked for asynchronous processing through the async parameter.
+    """
+    value = request.QUERY_PARAMS.get('async', request.DATA.get('async'))
+    if value is None:
+        return settings.PROVISIONING_ASYNC_DEFAULT
+    return str(value).lower() in ('true', '1', 'yes')
+
+def is_streaming(request):
+    """
+    Whether a request asked for a streamed response through the stream parameter.
+    """
+    value = request.QUERY_PARAMS.get('stream')
+    if value is None:
+        return settings.STREAM_LISTINGS_DEFAULT
+    return str(value).lower() in ('true', '1', 'yes')
+
+def etag_matches(request, etag):
+    """
+    Whether the If-None-Match header of a request matches etag.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+def not_modified(etag):
+    rsp = HttpResponseNotModified()
+    rsp['ETag'] = quote_etag(etag)
+    return rsp
+
+def get_page(request):
+    """
+    Returns the offset and limit (None for no limit) of the page of a listing requested through the offset
+    and limit query parameters.
+    """
+    try:
+        offset = int(request.QUERY_PARAMS.get('offset') or 0)
+        limit = request.QUERY_PARAMS.get('limit')
+        limit = int(limit) if limit not in (None, '') else None
+    except ValueError:
+        raise Error(message="offset and limit must be integers.")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise Error(message="offset and limit must not be negative.")
+    return offset, limit
+
+def paginate(items, offset=0, limit=None):
+    """
+    Returns the page of a list of items starting at offset and holding at most limit items.
+    """
+    if limit is None:
+        return items[offset:]
+    return items[offset:offset + limit]
+
 def get_parms_from_request(request_dict, parms):
     """
     Helper method to pull required parameters out of a request.
@@ -228,21 +438,125 @@ def get_parms_from_request(request_dict, parms):
         parm_values[parm] = value
     return parm_values
 
-def create_client_application(cookies, username, application_name, tier=settings.DEFAULT_TIER,
-                              description=None, callbackUrl=None):
+def validate_tier(tier):
     """
-    Create a client application with the given name, throttling tier, description and callbackUrl.
+    Returns the canonical name of a throttling tier, ignoring case; raises an Error for invalid tiers.
     """
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_ADD_APP_URL
     VALID_TIERS = ['Bronze', 'Gold', 'Unlimited', 'Silver']
-    found = False
     for t in VALID_TIERS:
-        if t.lower() == tier.lower():
-            tier = t
-            found = True
-    if not found:
-        raise Error(message="tier value must be one of: [Bronze, Gold, Unlimited, Silver].")
+        if isinstance(tier, basestring) and t.lower() == tier.lower():
+            return t
+    raise Error(message="tier value must be one of: [Bronze, Gold, Unlimited, Silver].")
+
+def validate_client_name(name):
+    """
+    Raises an Error for client names whose URL would not resolve to the client: names taken by other
+    resources of the API, such as _metrics and _batch, and names ending in / or in the name of a resource
+    of a client, such as /subscriptions.
+    """
+    try:
+        match = resolve(urlunquote(reverse('client_details', args=[name])))
+    except (NoReverseMatch, Resolver404):
+        match = None
+    if not match or match.url_name != 'client_details' or match.kwargs.get('client_name') != name:
+        raise Error(message="clientName " + name + " is reserved: its URL belongs to another resource.")
+
+def get_batch_operations(data):
+    """
+    Parses the body of a batch request into a list of (action, client name, params) operations, where
+    params are the keyword arguments of create_client_application for creations and empty for deletions.
+    """
+    if hasattr(data, 'getlist'):
+        # form data can only carry client names.
+        creates, deletes = data.getlist('create'), data.getlist('delete')
+    else:
+        creates, deletes = data.get('create') or [], data.get('delete') or []
+    if not isinstance(creates, list) or not isinstance(deletes, list):
+        raise Error("create and delete must be lists.")
+    operations = []
+    for spec in creates:
+        if not isinstance(spec, dict):
+            spec = {'clientName': spec}
+        if not spec.get('clientName'):
+            raise Error("clientName is required for each client to create.")
+        # validated up front: nothing can be reported once the results have started streaming.
+        for field in ('clientName', 'description', 'callbackUrl'):
+            if spec.get(field) is not None and not isinstance(spec[field], basestring):
+                raise Error(field + " must be a string.")
+        validate_client_name(spec['clientName'])
+        operations.append(('create', spec['clientName'],
+                           {'tier': validate_tier(spec.get('tier', settings.DEFAULT_TIER)),
+                            'description': spec.get('description', ''),
+                            'callbackUrl': spec.get('callbackUrl', '')}))
+    for name in deletes:
+        if not name or not isinstance(name, basestring):
+            raise Error("delete must be a list of client names.")
+        operations.append(('delete', name, {}))
+    if not operations:
+        raise Error("create or delete is required")
+    if len(operations) > settings.BATCH_MAX_ITEMS:
+        raise Error("A batch can contain at most " + str(settings.BATCH_MAX_ITEMS) + " clients.")
+    return operations
+
+def batch_result(action, client_name, result=None, error=None):
+    """
+    The entry reporting the outcome of one operation of a batch.
+    """
+    if error:
+        return {'action': action, 'clientName': client_name, 'status': 'error', 'message': error, 'result': None}
+    message = "Client created successfully." if action == 'create' else "Client removed successfully."
+    return {'action': action, 'clientName': client_name, 'status': 'success', 'message': message, 'result': result}
+
+def run_batch(cookies, username, operations, existing):
+    """
+    Runs the operations of a batch on BATCH_WORKERS threads, sharing the user's store session, and yields
+    the result of each one as it completes. existing holds the names of the user's applications before
+    the batch; operations that conflict with it, or with another operation of the batch, are rejected
+    without calling the store.
+    """
+    seen = set()
+    runnable = []
+    for action, name, params in operations:
+        if name in seen:
+            yield batch_result(action, name, error="Client " + name + " appears more than once in the batch.")
+        elif action == 'create' and name in existing:
+            yield batch_result(action, name, error="Client " + name + " already exists.")
+        elif action == 'delete' and name not in existing:
+            yield batch_result(action, name, error="Client " + name + " not found.")
+        else:
+            runnable.append((action, name, params))
+        seen.add(name)
+
+    def run(operation):
+        action, name, params = operation
+        if action == 'create':
+            return present_new_app(create_client_application(cookies, username, name, **params))
+        delete_client(cookies, name, username=username)
+
+    try:
+        for result in fan_out_iter(run, runnable, workers=settings.BATCH_WORKERS):
+            action, name, params = result.item
+            if isinstance(result.error, Error):
+                yield batch_result(action, name, error=result.error.message)
+            elif result.error:
+                logger.error("Uncaught exception in batch %s of client %s: %s", action, name, result.error)
+                yield batch_result(action, name, error="Unable to " + action + " client.")
+            else:
+                yield batch_result(action, name, result=result.value)
+    finally:
+        caches.invalidate_applications(username)
 
+def create_client_application(cookies, username, application_name, tier=settings.DEFAULT_TIER,
+                              description=None, callbackUrl=None, progress=None):
+    """
+    Create a client application with the given name, throttling tier, description and callbackUrl.
+    progress, if given, is called with the name of each step of the pipeline (see
+    agave_clients.service.provisioning.STEPS) as it starts.
+    """
+    progress = progress or (lambda step: None)
+    tier = validate_tier(tier)
+    validate_client_name(application_name)
+    progress('add_application')
     params = {'action': 'addApplication',
               'application': application_name,
               'tier': tier,
@@ -252,45 +566,60 @@ def create_client_application(cookies, username, application_name, tier=settings
         params['description'] = description
     if callbackUrl:
         params['callbackUrl'] = callbackUrl
-    try:
-        rsp = requests.post(url, cookies=cookies, params=params, verify=False)
-    except Exception as e:
-        raise Error("Unable to create application; " + str(e))
-    if not rsp.status_code == 200:
-        raise Error("Unable to create application; status code:" +
-                    str(rsp.status_code))
-    if rsp.json().get('error'):
-        raise Error("Unable to create application: " +
-                    str(rsp.json().get('message')))
-    logger.info("Response from WSO2 ADD_APP: " + str(rsp.json()) + " Status code: " + str(rsp.status_code))
+    get_store_client().call('POST', settings.STORE_ADD_APP_URL, "Unable to create application",
+                            cookies=cookies, params=params)
+    logger.info("Application %s added in WSO2.", application_name)
 
     # nothing returned in the wso2 response and the client credentials are not generated,
     # so we need to get the client just created and generate credentials for it.
     # Need to generate credentials FIRST -- otherwise, get_application will end up generating them which
     # will cause the consumerSecret to be lost.
 
+    progress('generate_credentials')
     credentials = generate_credentials(cookies, application_name, callbackUrl)
-    app = get_application(cookies, username, application_name, sanitize=False)
-    add_apis(cookies, application_name)
+    progress('get_application')
+    # the key mapping of the new application may not be visible in the db yet; looking it up would generate
+    # new credentials, so pass the key along.
+    app = get_application(cookies, username, application_name, sanitize=False,
+                          consumer_key=(credentials or {}).get('consumerKey'))
+    progress('add_apis')
+    add_apis(cookies, application_name, username=username)
     app.update(credentials)
-    logger.info("Inside create_client_application after updating with credentials; app: " + str(app)
-                + "credentials: " + str(credentials))
+    keyindex.record_key(app.get("id"), app.get("consumerKey"))
 
     # we now fix the record on the IDN_OAUTH_CONSUMER_APPS table in WSO2 db so that the Auth grant
     # flow will work.
     if callbackUrl:
+        progress('update_callback_url')
         try:
-            wso2_app = IdnOauthConsumerApps.objects.get(consumer_key=app.get("consumerKey"))
-            wso2_app.callback_url = callbackUrl
-            wso2_app.save()
+            # a single UPDATE; there is no need to read the row first.
+            with metrics.timed_db('consumer_app_callback'):
+                updated = IdnOauthConsumerApps.objects.filter(consumer_key=app.get("consumerKey")).update(
+                    callback_url=callbackUrl)
+            if not updated:
+                logger.info("No consumer app found to update the callback URL of %s.", application_name)
         except Exception as e:
-            logger.info("Got an exception trying to update the callback URL. Exception type: "+
-            str(type(e)) + " Exception: " + str(e))
+            logger.info("Got an exception trying to update the callback URL. Exception type: %s Exception: %s",
+                        type(e), e)
+
+    return app
 
+def present_new_app(app):
+    """
+    Sanitizes a newly created application. sanitize_app removes the consumerSecret, which in this one case
+    we actually want to send back to the user, so it is put back.
+    """
+    secret = app.get("consumerSecret")
+    app = sanitize_app(app)
+    app['consumerSecret'] = secret
     return app
 
-def add_api(cookies, client_name, api_name, api_version, api_provider, tier=settings.DEFAULT_TIER):
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_SUBSCRIPTION_URL
+def add_api(cookies, client_name, api_name, api_version, api_provider, tier=settings.DEFAULT_TIER,
+            username=None):
+    """
+    Subscribes an application to an API. When username is given, the cached subscriptions of the
+    application are invalidated.
+    """
     data = {'action': 'addAPISubscription',
             'name': api_name,
             'version': api_version,
@@ -298,274 +627,365 @@ def add_api(cookies, client_name, api_name, api_version, api_provider, tier=sett
             'tier': tier,
             'applicationName': client_name}
     try:
-        r = requests.post(url, cookies=cookies, data=data, verify=False)
-        logger.info("add_api response:" + str(r.json()))
-        logger.info("data:" + str(data))
-    except Exception as e:
-        raise Error("Unable to subscribe to API " + api_name +
-                    "; message: " + str(e))
-    try:
-        json_rsp = r.json()
-    except Exception as e:
-        raise Error("Unable to subscribe to API " + api_name + "; no JSON received.")
-    # APIM now throws an error if the API is subscribed to already.
-    if json_rsp.get('message') and 'Subscription already exists' in json_rsp.get('message'):
-        return
-    if not r.status_code == 200:
-        raise Error("Unable to subscribe to API " + api_name +
-                    "; status code: " + str(r.status_code))
-    if r.json().get('error'):
-        raise Error("Unable to subscribe to API " + api_name + " error: " + str(r.json().get('error')))
+        # APIM now throws an error if the API is subscribed to already.
+        get_store_client().call('POST', settings.STORE_SUBSCRIPTION_URL, "Unable to subscribe to API " + api_name,
+                                cookies=cookies, data=data, accept=['Subscription already exists'])
+    finally:
+        caches.invalidate_subscriptions(username, client_name)
 
-def add_apis(cookies, client_name, tier=settings.DEFAULT_TIER):
+def add_apis(cookies, client_name, tier=settings.DEFAULT_TIER, username=None):
     """
-    Subscribes to Agave APIs for an application at level 'tier'.
+    Subscribes an application to the APIs in the catalog at level 'tier'. The subscriptions are made
+    concurrently; returns the per-API results and raises a single Error listing every API that could not
+    be added.
     """
-    for api in AGAVE_APIS:
-        add_api(cookies, client_name, api.get('name'), api.get('version'), api.get('provider'))
+    tier = validate_tier(tier)
+    try:
+        results = fan_out(lambda api: add_api(cookies, client_name, api['name'], api['version'],
+                                              api['provider'], tier=tier),
+                          catalog.get_apis())
+    finally:
+        caches.invalidate_subscriptions(username, client_name)
+    raise_for_failures(results, "Unable to subscribe " + client_name + " to Agave APIs",
+                       describe=lambda api: api.get('name'))
+    return results
 
 def generate_credentials(cookies, application_name, callbackUrl=None):
     """
     Generates credentials for a given application. Application must be subscribed to at least one API.
     """
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_SUBSCRIPTION_URL
     data = {'action' :'generateApplicationKey',
             'application' : application_name,
             'keytype' : 'PRODUCTION',
             'authorizedDomains' : 'ALL',
             'validityTime' : '14400',}
-    logger.info("application name: " + application_name)
     if callbackUrl:
         data['callbackUrl'] = callbackUrl
-    try:
-        rsp = requests.post(url, cookies=cookies, data=data, verify=False)
-        logger.info("Status code:" + str(rsp.status_code) + "content: " + str(rsp.content))
-    except Exception as e:
-        raise Error("Unable to generate credentials for " + str(application_name) + "; message: " + str(e))
-    if not rsp.status_code == 200:
-        raise Error("Unable to generate credentials for " + application_name +"; status code: " + str(rsp.status_code))
-    if not rsp.json().get("data"):
-        raise Error("Unable to generate credentials for " + application_name)
-    return rsp.json().get('data').get('key')
+    body = get_store_client().call('POST', settings.STORE_SUBSCRIPTION_URL,
+                                   "Unable to generate credentials for " + application_name,
+                                   cookies=cookies, data=data, required='data')
+    return body['data'].get('key')
+
+def retrieve_application_keys(application_ids):
+    """
+    Retrieves the PRODUCTION consumer keys for a list of application ids from the key index, querying the
+    AmApplicationKeyMapping table only for those it doesn't know. Returns a dict mapping application id to
+    consumer key; applications without a key are not in the dict.
+    """
+    return keyindex.get_keys(application_ids)
 
 def retrieve_application_key(cookies, application_id, application_name):
     """
     Retrieves application key directly from the AmApplicationKeyMapping table since APIM does not return
     it in their API.
     """
-    # app_key_mapping = AmApplicationKeyMapping.objects.filter(application=application_id)
-    app_key_mapping = AmApplicationKeyMapping.objects.filter(application_id=application_id)
+    consumer_key = retrieve_application_keys([application_id]).get(application_id)
+
+    if not consumer_key:
+        consumer_key = provision_application_key(cookies, application_id, application_name)
+    return consumer_key
 
+def provision_application_key(cookies, application_id, application_name):
+    """
+    Generates credentials for an application without a key and returns its consumer key: the key in the
+    generateApplicationKey response or, when the store doesn't return one, the key APIM records in the
+    AmApplicationKeyMapping table.
+    """
     # todo - Need a better solution here.
     # This is to handle the fact that the DefaultApplication generated by WSO2 does not have a clientKey
     # and that will break things unless we generate one. However, this is not a great solution because
     # without the consumerSecret the DefaultApplication will be useless to the user, and once the secret is
     # generated it cannot be obtained through the API again.
-    if app_key_mapping.count() < 1:
-        generate_credentials(cookies, application_name)
-        # we need to flush the read transaction on the db here to get a new one
-        transaction.enter_transaction_management()
-        transaction.commit()
-        app_key_mapping = AmApplicationKeyMapping.objects.filter(application_id=application_id)
+    credentials = generate_credentials(cookies, application_name) or {}
+    if credentials.get('consumerKey'):
+        keyindex.record_key(application_id, credentials['consumerKey'])
+        return credentials['consumerKey']
+    return wait_for_application_key(application_id, application_name)
 
-    return app_key_mapping.values()[0].get('consumer_key')
+def wait_for_application_key(application_id, application_name):
+    """
+    Polls the AmApplicationKeyMapping table for the key of an application, backing off exponentially from
+    APPLICATION_KEY_WAIT_DELAY to APPLICATION_KEY_WAIT_MAX_DELAY seconds between queries, until the key
+    shows up or APPLICATION_KEY_WAIT_TIMEOUT seconds have passed.
+    """
+    deadline = time.time() + settings.APPLICATION_KEY_WAIT_TIMEOUT
+    delay = settings.APPLICATION_KEY_WAIT_DELAY
+    while True:
+        # the db connection is in autocommit mode, so each query sees the key as soon as APIM commits it.
+        consumer_key = retrieve_application_keys([application_id]).get(application_id)
+        if consumer_key:
+            return consumer_key
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise Error("Unable to retrieve credentials for " + application_name)
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, settings.APPLICATION_KEY_WAIT_MAX_DELAY)
 
+def provision_application_keys(cookies, apps):
+    """
+    Provisions the keys of several applications without one concurrently. Returns a dict mapping
+    application id to consumer key for the applications whose key could be provisioned.
+    """
+    keys = {}
+    results = fan_out(lambda app: provision_application_key(cookies, app.get("id"), app.get("name")), apps)
+    for result in results:
+        if result.error:
+            # It is valid for applications to not have credentials;
+            logger.error("Unable to retrieve credentials for %s: %s", result.item.get("name"), result.error)
+        else:
+            keys[result.item.get("id")] = result.value
+    return keys
 
-def delete_client(cookies, application_name):
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_REMOVE_APP_URL
+
+def delete_client(cookies, application_name, username=None):
+    """
+    Removes an application. When username is given, the cached subscriptions of the application are
+    invalidated.
+    """
     params = {'action': 'removeApplication',
               'application': application_name,}
     try:
-        r = requests.post(url, cookies=cookies, params=params, verify=False)
-    except Exception as e:
-        raise Error("Unable to create application; " + str(e))
-    if not r.status_code == 200:
-        raise Error("Unable to create application; status code:" +
-                    str(r.status_code))
-    logger.info("response: " + str(r) + "json: " + str(r.json()))
-
-def remove_api(cookies, client_name, api_name, api_version, api_provider):
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_REMOVE_SUB_URL
+        get_store_client().call('POST', settings.STORE_REMOVE_APP_URL, "Unable to remove application",
+                                cookies=cookies, params=params)
+    finally:
+        caches.invalidate_subscriptions(username, application_name)
+
+def remove_api(cookies, client_name, api_name, api_version, api_provider, username=None):
+    """
+    Removes an application's subscription to an API. When username is given, the cached subscriptions of
+    the application are invalidated.
+    """
     data = {'action': 'removeSubscription',
             'name': api_name,
             'version': api_version,
             'provider': api_provider,
             'applicationName': client_name}
     try:
-        r = requests.post(url, cookies=cookies, data=data, verify=False)
-        logger.info("remove_api response:" + str(r.json()))
-        logger.info("data:" + str(data))
-    except Exception as e:
-        raise Error("Unable to remove API " + api_name +
-                    "; message: " + str(e))
-    if not r.status_code == 200:
-        raise Error("Unable to remove API " + api_name +
-                    "; status code: " + str(r.status_code))
-    if r.json().get('error'):
-        raise Error("Unable to remove API " + + api_name)
+        get_store_client().call('POST', settings.STORE_REMOVE_SUB_URL, "Unable to remove API " + api_name,
+                                cookies=cookies, data=data)
+    finally:
+        caches.invalidate_subscriptions(username, client_name)
 
-def remove_apis(cookies, application_name):
+def remove_apis(cookies, application_name, username=None):
     """
-    Subscribes to Agave APIs for an application at level 'tier'.
+    Removes all subscriptions for an application. The subscriptions are removed concurrently; returns the
+    per-API results and raises a single Error listing every API that could not be removed.
     """
-    subscriptions = get_subscriptions(cookies, application_name, sanitize=False)
-    for api in subscriptions:
-        remove_api(cookies, application_name, api.get('name'), api.get('version'), api.get('provider'))
+    subscriptions = get_subscriptions(cookies, application_name, sanitize=False, username=username) or []
+    try:
+        results = fan_out(lambda api: remove_api(cookies, application_name, api.get('name'),
+                                                 api.get('version'), api.get('provider')),
+                          subscriptions)
+    finally:
+        caches.invalidate_subscriptions(username, application_name)
+    raise_for_failures(results, "Unable to remove APIs from " + application_name,
+                       describe=lambda api: api.get('name'))
+    return results
 
 
-def get_applications(cookies, username, sanitize=True):
+def fetch_applications(cookies):
     """
-    Retrieve the list of applications for the user of a session.
+    Retrieves the undecorated list of applications of the user of a session from the store.
     """
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_APPS_URL
     params = {'action': 'getApplications'}
-    try:
-        r = requests.get(url, cookies=cookies, params=params, verify=False)
-    except Exception as e:
-        raise Error("Unable to retrieve clients; " + str(e))
-    if not r.status_code == 200:
-        raise Error("Unable to retrieve clients; status code:" +
-                    str(r.status_code))
-    if not r.json().get("applications"):
-        raise Error("Unable to retrieve clients; content: " + str(r.content))
-    apps = r.json().get("applications")
+    body = get_store_client().call('GET', settings.STORE_APPS_URL, "Unable to retrieve clients",
+                                   cookies=cookies, params=params, required='applications')
+    return body['applications']
+
+def get_applications(cookies, username, sanitize=True, known_keys=None):
+    """
+    Retrieve the list of applications for the user of a session.
+    """
+    return list(decorate_applications(cookies, username, fetch_applications(cookies), sanitize, known_keys))
+
+def decorate_applications(cookies, username, apps, sanitize=True, known_keys=None):
+    """
+    Adds the consumer key and hyperlinks to each of a list of applications from the store listing.
+    known_keys maps the names of applications to consumer keys already known to the caller. The keys are
+    retrieved (and generated) before this returns; the applications are decorated one at a time as the
+    returned iterator is consumed, which can no longer fail on the store or the db, so that a streamed
+    response is never cut short.
+    """
+    # look up the keys for all of the applications at once; credentials are generated, concurrently, only
+    # for the applications still missing a key.
+    application_keys = retrieve_application_keys([app.get("id") for app in apps])
+    for app in apps:
+        if known_keys and known_keys.get(app.get("name")):
+            application_keys[app.get("id")] = known_keys[app.get("name")]
+    keyless = [app for app in apps if not application_keys.get(app.get("id"))]
+    if keyless:
+        application_keys.update(provision_application_keys(cookies, keyless))
+    return _decorate_applications(username, apps, application_keys, sanitize)
+
+def _decorate_applications(username, apps, application_keys, sanitize):
     for app in apps:
         application_name = app.get("name")
-        try:
-            application_key = retrieve_application_key(cookies, app.get("id"), application_name)
-            app['consumerKey'] = application_key
-        except Exception as e:
-            # It is valid for applications to not have credentials;
-            logger.error("Unable to retrieve credentials for " + application_name + " in get_applications: " + str(e))
-            # raise Error("Unable to retrieve credentials for " + application_name)
-        # app.update(credentials)
-        add_hyperlinks(app, username)
-        if sanitize:
-            sanitize_app(app)
-    return apps
+        if application_keys.get(app.get("id")):
+            app['consumerKey'] = application_keys[app.get("id")]
+        app['_links'] = projections.application_links(application_name, username)
+        yield sanitize_app(app) if sanitize else app
 
-def add_hyperlinks(app, username):
+def get_applications_cached(cookies, username, offset=0, limit=None, lazy=False, version=None):
     """
-    Add references to self, subscriber and subscriptions.
+    Read-through cache of the sanitized application listing of a user. Returns the page of the
+    applications given by offset and limit and whether they were served from the cache.
+
+    Only complete listings are cached. On a miss for a page, only the applications of the page are
+    decorated; when lazy is set the applications are decorated as they are iterated over. version is the
+    version stamp of the user's listing, when the caller has already read it.
     """
-    app['_links'] = {'self': {'href': settings.APP_BASE + reverse('clients') + urllib.quote(app.get('name'))},
-                     'subscriber': {'href': settings.APP_BASE + '/profiles/'
-                                            + settings.AGAVE_API_VERSION + '/' + username},
-                     'subscriptions': {'href': settings.APP_BASE + reverse('client_subscriptions',
-                                                                           args=[app.get('name')])}}
+    version = version or caches.get_version(username)
+    applications = caches.get_applications(username, version)
+    if applications is not None:
+        return paginate(applications, offset, limit), True
+    if not offset and limit is None and not lazy:
+        applications = get_applications(cookies, username)
+        caches.set_applications(username, applications, version)
+        return applications, False
+    applications = decorate_applications(cookies, username, paginate(fetch_applications(cookies), offset, limit))
+    return (applications if lazy else list(applications)), False
 
+def get_cached_application(username, application_name, version=None):
+    """
+    Returns the application with name application_name from the user's cached listing, or None if the
+    listing is not cached or does not contain it.
+    """
+    for app in caches.get_applications(username, version) or []:
+        if app.get("name") == application_name:
+            return app
+    return None
 
 def sanitize_app(app):
     """
-    Removes fields returned from WSO2 that should not be shown to the user.
+    Returns the representation of an application shown to the user: a new dict holding only the fields of
+    the application in the projections.application allowlist.
     """
-    app.pop("id", None)
-    app.pop("enableRegenarate", None)
-    app.pop("consumerSecret", None)
-    app.pop("accessToken", None)
-    app.pop("accessallowdomains", None)
-    app.pop("validityTime", None)
-    app.pop("status", None)
-    app.pop("keyState", None)
-    app.pop("tokenDetails", None)
-    app.pop("apiCount", None)
-    app.pop("tokenScope", None)
-    app.pop("appDetails", None)
-    app.pop("groupId", None)
+    return projections.application(app)
 
 
+def lookup_application(username, application_name):
+    """
+    Looks up a single application of a user directly in the APIM db. Returns the application in the form
+    returned by the store's application listing, or None if no such application was found.
+    """
+    applications = AmApplication.objects.filter(name=application_name, subscriber__user_id=username)
+    with metrics.timed_db('application'):
+        rows = list(applications.values('application_id', 'name', 'application_tier', 'callback_url',
+                                        'description', 'application_status', 'group_id')[:1])
+    if not rows:
+        return None
+    row = rows[0]
+    return {'id': row['application_id'],
+            'name': row['name'],
+            'tier': row['application_tier'],
+            'callbackUrl': row['callback_url'],
+            'description': row['description'],
+            'status': row['application_status'],
+            'groupId': row['group_id']}
 
-def get_application(cookies, username, application_name="DefaultApplication", sanitize=True):
+def lookup_application_names(username):
     """
-    Gets the application in WSO2 with name application_name
+    Returns the names of the applications of a user, from the APIM db.
     """
-    logger.info("application name: " + application_name)
-    applications = get_applications(cookies, username, sanitize)
-    for app in applications:
-        if app.get("name") == application_name:
-            logger.info(str(app))
-            return app
-    raise Error("Application not found")
+    applications = AmApplication.objects.filter(subscriber__user_id=username)
+    with metrics.timed_db('application_names'):
+        return list(applications.values_list('name', flat=True))
+
+def get_application(cookies, username, application_name="DefaultApplication", sanitize=True,
+                    consumer_key=None):
+    """
+    Gets the application in WSO2 with name application_name. consumer_key is the key of the application,
+    when the caller already knows it.
+    """
+    app = lookup_application(username, application_name)
+    if not app:
+        # the application may still be known to the store, for instance when the username is stored in
+        # the APIM db in a different form, so fall back to the full listing.
+        applications = get_applications(cookies, username, sanitize,
+                                        known_keys={application_name: consumer_key} if consumer_key else None)
+        for app in applications:
+            if app.get("name") == application_name:
+                return app
+        raise Error("Application not found")
+    try:
+        app['consumerKey'] = consumer_key or retrieve_application_key(cookies, app.get("id"), application_name)
+    except Exception as e:
+        # It is valid for applications to not have credentials;
+        logger.error("Unable to retrieve credentials for %s in get_application: %s", application_name, e)
+    app['_links'] = projections.application_links(application_name, username)
+    return sanitize_app(app) if sanitize else app
 
 
 def get_application_id(cookies, username, application_name="DefaultApplication"):
     """
     Gets the application id in WSO2 for the application with name application_name
     """
+    app = lookup_application(username, application_name)
+    if app:
+        return app.get("id")
     applications = get_applications(cookies, username, sanitize=False)
     for app in applications:
         if app.get("name") == application_name:
             return app.get("id")
     raise Error("Application not found")
 
-def get_subscriptions(cookies, application_name, sanitize=True):
+def fetch_subscriptions(cookies, application_name):
     """
-    Returns the subscriptions for an application.
+    Retrieves subscriptions from the store. WSO2 returns the subscriptions of all of the user's
+    applications, so this returns a dict mapping application name to the list of its subscriptions.
     """
-    url = settings.APIM_STORE_SERVICES_BASE_URL + settings.STORE_LIST_SUBS_URL
     params = {'action': 'getAllSubscriptions', 'selectedApp': application_name}
-    try:
-        r = requests.get(url, cookies=cookies, params=params, verify=False)
-    except Exception as e:
-        raise Error("Unable to retrieve subscriptions; " + str(e))
-    if not r.status_code == 200:
-        raise Error("Unable to retrieve subscriptions; status code:" +
-                    str(r.status_code))
-    if r.json().get("error"):
-        raise Error("Unable to retrieve subscriptions; error:" +
-                    str(r.json().get("message")))
-    if not r.json().get("subscriptions"):
-        raise Error("Unable to retrieve subscriptions; content: " + str(r.content))
-    # WSO2 actually returns a list of applications, so we need to filter by the application_name
-    apps = r.json().get("subscriptions").get('applications')
-    for app in apps:
-        logger.info("app:" + app.get("name"))
-        if app.get('name') == application_name:
-            subscriptions = app.get("subscriptions")
-            for sub in subscriptions:
-                add_sub_hyperlinks(sub, application_name)
-                if sanitize:
-                    sanitize_subscription(sub)
-            return subscriptions
+    body = get_store_client().call('GET', settings.STORE_LIST_SUBS_URL, "Unable to retrieve subscriptions",
+                                   cookies=cookies, params=params, required='subscriptions')
+    apps = body['subscriptions'].get('applications') or []
+    return dict((app.get('name'), app.get('subscriptions')) for app in apps)
 
-def add_sub_hyperlinks(sub, client_name):
+def get_subscriptions(cookies, application_name, sanitize=True, username=None, offset=0, limit=None,
+                      lazy=False, version=None):
     """
-    Add references to self, api and client.
+    Returns the page of the subscriptions for an application given by offset and limit. When username is
+    given, the subscriptions are read through the subscription cache; a miss caches the subscriptions of
+    all of the user's applications. When lazy is set, the subscriptions are decorated as they are iterated
+    over. version is the version stamp of the application's subscriptions, when the caller has already
+    read it.
     """
-    sub['_links'] = {'self': {'href': settings.APP_BASE + reverse('client_subscriptions',
-                                                                  args=[client_name])},
-                     'api': {'href': settings.APP_BASE + sub.get('context') + '/'},
-                     'client': {'href': settings.APP_BASE + reverse('client_details', args=[client_name])},
-                     }
+    subscriptions = None
+    if username:
+        version = version or caches.get_version(username, application_name)
+        subscriptions = caches.get_subscriptions(username, application_name, version)
+    if subscriptions is None:
+        if username:
+            # the stamps must be read before the store call: subscriptions read before a change must not be
+            # cached under the stamp the change gives the client.
+            versions = caches.get_client_versions(username, [name for name in lookup_application_names(username)
+                                                             if name != application_name])
+            versions[application_name] = version
+        all_subscriptions = fetch_subscriptions(cookies, application_name)
+        if username:
+            # clients whose stamps were not read (e.g. not found in the db) are not cached.
+            caches.set_subscriptions(username, dict((name, subs) for name, subs in all_subscriptions.items()
+                                                    if name in versions), versions)
+        subscriptions = all_subscriptions.get(application_name)
+        if subscriptions is None:
+            return None
+    subscriptions = decorate_subscriptions(paginate(subscriptions, offset, limit), application_name, sanitize)
+    return subscriptions if lazy else list(subscriptions)
 
+def decorate_subscriptions(subscriptions, client_name, sanitize=True):
+    """
+    Adds hyperlinks to each of a list of subscriptions of a client and yields them one at a time.
+    """
+    links = projections.subscription_links(client_name)
+    for sub in subscriptions:
+        sub['_links'] = links(sub)
+        yield sanitize_subscription(sub) if sanitize else sub
 
 def sanitize_subscription(subscription):
     """
-    Removes fields returned from WSO2 that should not be shown to the user.
-    """
-    subscription.pop("subStatus", None)
-    subscription.pop("thumburl", None)
-    subscription.pop("prodKey", None)
-    subscription.pop("prodConsumerKey", None)
-    subscription.pop("prodConsumerSecret", None)
-    subscription.pop("prodAuthorizedDomains", None)
-    subscription.pop("prodValidityTime", None)
-    subscription.pop("prodValidityRemainingTime", None)
-    subscription.pop("sandboxKey", None)
-    subscription.pop("sandboxConsumerKey", None)
-    subscription.pop("sandboxConsumerSecret", None)
-    subscription.pop("sandAuthorizedDomains", None)
-    subscription.pop("sandValidityTime", None)
-    subscription.pop("sandValidityRemainingTime", None)
-    subscription.pop("hasMultipleEndpoints", None)
-
-    subscription['apiName'] = subscription.pop('name')
-    subscription['apiStatus'] = subscription.pop('status')
-    subscription['apiVersion'] = subscription.pop('version')
-    subscription['apiContext'] = subscription.pop('context')
-    subscription['apiProvider'] = subscription.pop('provider')
-
-
+    Returns the representation of a subscription shown to the user: a new dict holding only the fields of
+    the subscription in the projections.subscription allowlist, renamed (name to apiName, etc.).
+    """
+    return projections.subscription(subscription)
 
 
 # ------------
@@ -3,16 +3,25 @@ __author__ = 'jstubbs'
 
 # Django settings for Agave clients service
 import os
+import sys
 
-# sensitive settings:
+# sensitive settings. The module is imported once; its settings are applied here, as the settings below
+# depend on them, and again at the end so that they override the defaults below.
 try:
-    from deployment_settings import *
+    import deployment_settings as sensitive_settings
 except:
     try:
-        from local_settings import *
+        import local_settings as sensitive_settings
     except Exception as e:
-        print "Unable to import local_settings" + str(e)
-        from local_settings_example import *
+        # mod_wsgi may not allow writing to stdout.
+        sys.stderr.write("Unable to import local_settings: " + str(e) + "\n")
+        import local_settings_example as sensitive_settings
+
+def apply_sensitive_settings():
+    globals().update((name, value) for name, value in vars(sensitive_settings).items()
+                     if not name.startswith('_'))
+
+apply_sensitive_settings()
 
 # ---------------
 # AUTHENTICATION
@@ -33,10 +42,198 @@ STORE_LIST_SUBS_URL = '/subscription/subscription-list/ajax/subscription-list.ja
 STORE_APPS_URL = "/application/application-list/ajax/application-list.jag"
 STORE_ADD_APP_URL = "/application/application-add/ajax/application-add.jag"
 STORE_REMOVE_APP_URL = "/application/application-remove/ajax/application-remove.jag"
+STORE_API_LIST_URL = "/api/listing/ajax/list.jag"
 DEFAULT_TIER = "Unlimited"
 AGAVE_API_VERSION = 'v2'
 
 
+# ---------------------------------
+# HTTP client for the APIM store
+# ---------------------------------
+# All store calls share a pool of keep-alive connections per process. STORE_POOL_MAXSIZE should be at
+# least the number of threads per process that can talk to the store at once.
+STORE_POOL_CONNECTIONS = 2
+STORE_POOL_MAXSIZE = 20
+# When True, threads wait for a free pooled connection instead of opening extra, unpooled ones.
+STORE_POOL_BLOCK = False
+STORE_VERIFY_SSL = False
+
+# Timeouts, in seconds, for calls to the store. STORE_TIMEOUTS holds (connect, read) overrides for
+# individual store endpoints.
+STORE_CONNECT_TIMEOUT = 5
+STORE_READ_TIMEOUT = 30
+STORE_TIMEOUTS = {
+    STORE_APPS_URL: (STORE_CONNECT_TIMEOUT, 60),
+    STORE_LIST_SUBS_URL: (STORE_CONNECT_TIMEOUT, 60),
+}
+
+# Idempotent (GET) store calls failing with a transport error or one of STORE_RETRY_STATUSES are retried
+# up to STORE_RETRIES times, waiting a random delay of up to STORE_RETRY_BACKOFF seconds, doubled at every
+# retry.
+STORE_RETRIES = 2
+STORE_RETRY_BACKOFF = 0.2
+STORE_RETRY_STATUSES = [502, 503, 504]
+
+# After STORE_BREAKER_THRESHOLD consecutive failed store calls, store calls fail fast with a 503 for
+# STORE_BREAKER_RESET seconds before the store is tried again.
+STORE_BREAKER_THRESHOLD = 5
+STORE_BREAKER_RESET = 30
+
+# Maximum number of store calls made in parallel for bulk operations such as subscribing a client to all
+# of the Agave APIs.
+STORE_FANOUT_WORKERS = 10
+
+# Applications without a key get credentials generated when they are listed. When the store doesn't return
+# the key, the APIM db is polled for it, backing off from APPLICATION_KEY_WAIT_DELAY to
+# APPLICATION_KEY_WAIT_MAX_DELAY seconds between queries, for at most APPLICATION_KEY_WAIT_TIMEOUT seconds.
+APPLICATION_KEY_WAIT_TIMEOUT = 5
+APPLICATION_KEY_WAIT_DELAY = 0.05
+APPLICATION_KEY_WAIT_MAX_DELAY = 1
+
+# Log the request and response payloads of every store call at DEBUG level. Listings can be large, so
+# this is off by default independently of the log level. Payloads include consumer secrets; never enable
+# it in production.
+STORE_DEBUG_PAYLOADS = False
+
+
+# ----------
+# Start up
+# ----------
+# Warm up each process as wsgi.py is loaded: import the views, open the store and db connections and load
+# the API catalog and key index before the first request (see deployment/apache2.conf).
+STARTUP_WARM_UP = True
+# Log whether the store and the db can be reached as each process starts.
+STARTUP_SELF_CHECK = True
+
+
+# -------------
+# API catalog
+# -------------
+# Where the APIs clients are subscribed to come from: 'settings' for the core Agave APIs at
+# AGAVE_API_VERSION plus ADDITIONAL_APIS, 'file' for the JSON file API_CATALOG_FILE (a list of APIs, or an
+# object mapping tenant hosts to lists with a 'default' entry), or 'store' for the APIs published in the
+# store by the providers in API_CATALOG_STORE_PROVIDERS (all providers if empty).
+API_CATALOG_SOURCE = 'settings'
+API_CATALOG_FILE = ''
+API_CATALOG_STORE_PROVIDERS = ['admin']
+# Seconds each process keeps the catalog before loading it again.
+API_CATALOG_REFRESH = 300
+
+
+# -----------------------
+# Store session caching
+# -----------------------
+# Store login sessions are cached per set of credentials so that requests don't have to log in to the
+# store each time. Use 'agave_clients.service.sessions.DjangoCacheSessionBackend' to share the sessions
+# across processes through the Django cache named by STORE_SESSION_CACHE_ALIAS (e.g. memcached).
+STORE_SESSION_BACKEND = 'agave_clients.service.sessions.LocalSessionBackend'
+STORE_SESSION_CACHE_ALIAS = 'default'
+# Seconds a session is reused for; keep this below the session timeout configured in the store.
+STORE_SESSION_TTL = 600
+# Maximum number of sessions kept by the in-process backend.
+STORE_SESSION_MAX_ENTRIES = 1000
+# Lower case fragments of the store's error messages that indicate an expired or invalid session.
+STORE_SESSION_EXPIRED_MARKERS = ['timeout', 'session expired', 'authenticateerror', 'login']
+
+
+# ---------------------
+# Listing caches
+# ---------------------
+# Django cache used for the per-user application listings. Use a shared cache (e.g. memcached) when
+# running more than one process so that invalidations made by one process are seen by the others.
+CLIENTS_CACHE_ALIAS = 'default'
+# Seconds a user's application listing is served from the cache. Changes made through this service
+# invalidate the listing immediately; the TTL bounds the staleness of changes made elsewhere.
+APPLICATIONS_CACHE_TTL = 30
+# Seconds the subscriptions of a client are served from the cache.
+SUBSCRIPTIONS_CACHE_TTL = 30
+# Seconds the last application listing of a user is kept to be served, marked stale, while the store is
+# unavailable. 0 disables serving stale listings.
+STALE_LISTINGS_TTL = 3600
+# Seconds a user's version stamp lives. The stamp changes whenever the user's clients or subscriptions are
+# changed through this service; it tags the cached listings and is the basis of the ETags of the client
+# and subscription resources, which are checked before any store or db work. Changes made elsewhere are
+# picked up once the stamp expires, so keep it in line with the cache TTLs above.
+VERSION_STAMP_TTL = 30
+# Client and subscription listings are streamed to the client item by item when the request sets
+# stream=true; this setting is used when the request doesn't say.
+STREAM_LISTINGS_DEFAULT = False
+
+
+# -----------
+# Key index
+# -----------
+# Consumer keys are looked up in an in-process index of the AM_APPLICATION_KEY_MAPPING table instead of
+# the db. The index is loaded on first use and a background thread polls for the keys of new applications
+# every KEY_INDEX_POLL_INTERVAL seconds, reading at most KEY_INDEX_BATCH_SIZE rows per query, and reloads
+# the whole table every KEY_INDEX_RESYNC_INTERVAL seconds. Keys missing from the index are read from the db.
+KEY_INDEX_ENABLED = True
+KEY_INDEX_POLL_INTERVAL = 5
+KEY_INDEX_BATCH_SIZE = 1000
+KEY_INDEX_RESYNC_INTERVAL = 3600
+
+
+# -------------------------
+# Asynchronous provisioning
+# -------------------------
+# Clients are created in the background, and a 202 returned, when the request sets async=true; this
+# setting is used when the request doesn't say.
+PROVISIONING_ASYNC_DEFAULT = False
+# 'thread' runs provisioning jobs on a thread pool in the web process; 'beanstalk' queues them on
+# BEANSTALK_TUBE for the provisioning_worker management command (requires the beanstalkc package).
+PROVISIONING_BACKEND = 'thread'
+PROVISIONING_WORKERS = 4
+# Seconds the status of a provisioning job (and an undelivered consumerSecret) is kept.
+PROVISIONING_JOB_TTL = 3600
+# Seconds after which a job that has not finished and has made no progress (e.g. because the process
+# running it was recycled) is reported as failed, and the client may be created again.
+PROVISIONING_STALE_AFTER = 600
+
+
+# -------------------
+# Batch operations
+# -------------------
+# Maximum number of clients created or deleted by one request to /clients/v2/_batch.
+BATCH_MAX_ITEMS = 500
+# Number of clients of a batch processed at once. Each client creation makes up to STORE_FANOUT_WORKERS
+# store calls in parallel, so keep BATCH_WORKERS * STORE_FANOUT_WORKERS close to STORE_POOL_MAXSIZE.
+BATCH_WORKERS = 2
+
+
+# --------------------
+# APIM db connections
+# --------------------
+# Seconds connections to the APIM db are kept open for reuse by later requests; used as the CONN_MAX_AGE
+# of the databases that don't set one. 0 closes them at the end of every request.
+APIM_DB_CONN_MAX_AGE = 300
+# Ping a reused connection before a request uses it when it has been idle for more than
+# APIM_DB_PING_IDLE seconds, and replace it if the server has dropped it.
+APIM_DB_PING_ON_CHECKOUT = True
+APIM_DB_PING_IDLE = 30
+# Pools of the optional 'agave_clients.service.mysql_pool' engine (requires SQLAlchemy): connections kept
+# per process, extra connections allowed under load, seconds to wait for a connection and seconds after
+# which a connection is replaced.
+APIM_DB_POOL_SIZE = 5
+APIM_DB_POOL_MAX_OVERFLOW = 10
+APIM_DB_POOL_TIMEOUT = 10
+APIM_DB_POOL_RECYCLE = 3600
+
+
+# --------
+# Metrics
+# --------
+# Directory shared by all of the service's processes where each one writes a snapshot of its metrics so
+# that /clients/v2/_metrics reports the metrics of every process. When None, only the metrics of the
+# process serving the request are reported. The directory must not be shared with other hosts: snapshots
+# of processes that are not running on this host are deleted.
+METRICS_DIR = None
+# Minimum number of seconds between two snapshots written by a process.
+METRICS_FLUSH_INTERVAL = 5
+# Addresses /clients/v2/_metrics is served to; it requires no credentials. None serves it to anyone, in which
+# case the endpoint must be firewalled.
+METRICS_ALLOWED_ADDRESSES = ['127.0.0.1', '::1']
+
+
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DEBUG = DEBUG
 APPEND_SLASH = False
@@ -142,12 +339,16 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    # first, so that it answers CORS preflight requests before the request and view phases of the other
+    # middleware and before any view or authentication. The response phase of every middleware still runs.
+    'corsheaders.middleware.CorsMiddleware',
+    # next, so that the timings it reports cover the whole request:
+    'agave_clients.service.middleware.ServerTimingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -214,18 +415,22 @@ LOGGING = {
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'agave_clients.service.renderers.TimedJSONRenderer',
     ),
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
+# Seconds browsers may cache the answer to a preflight request instead of sending one before every call.
+CORS_PREFLIGHT_MAX_AGE = 86400
+# Request headers portals may send, including If-None-Match for the conditional GETs of the listings, and
+# response headers they may read.
+CORS_ALLOW_HEADERS = ('x-requested-with', 'content-type', 'accept', 'origin', 'authorization', 'x-csrftoken',
+                      'accept-encoding', 'user-agent', 'if-none-match')
+CORS_EXPOSE_HEADERS = ('etag', 'x-cache', 'server-timing', 'retry-after', 'warning')
 ADDITIONAL_APIS = []
 
-# sensitive settings:
-try:
-    from deployment_settings import *
-except:
-    try:
-        from local_settings import *
-    except:
-        from local_settings_example import *
+apply_sensitive_settings()
+
+# keep connections to the APIM db open between requests unless the database configuration says otherwise.
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', APIM_DB_CONN_MAX_AGE)
@@ -0,0 +1,256 @@
+'''
+Load test and benchmark harness for the clients REST endpoints.
+
+Runs the service in-process (through the Django test client, so no web server is needed) against the fake
+APIM store in agave_clients.tests.fake_store, seeded with users owning between 1 and 500 clients, and
+drives realistic request mixes against it:
+ - list:      portal polling; mostly GET /clients/v2 with some GET /clients/v2/{name} and subscriptions.
+ - churn:     create/delete cycles of clients (POST /clients/v2, DELETE /clients/v2/{name}).
+ - subscribe: wildcard subscribe/unsubscribe of a client (POST and DELETE .../subscriptions, apiName=*).
+
+For every scenario and user size it reports p50/p95/p99 latency, requests/sec, store (upstream) calls per
+request and db queries per request, and writes them to a JSON file that can be compared across commits:
+
+    python -m agave_clients.tests.benchmark --output before.json
+    ... change the code ...
+    python -m agave_clients.tests.benchmark --output after.json --compare before.json
+'''
+
+import base64
+import json
+import optparse
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib
+import uuid
+
+
+SCENARIOS = ['list', 'churn', 'subscribe']
+PASSWORD = 'benchmark'
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).strip()
+    except Exception:
+        return None
+
+def seed_user(db_path, username, app_count):
+    """
+    Creates a subscriber owning app_count clients, each with keys and subscribed to all of the APIs, directly
+    in the fake store's database.
+    """
+    db = sqlite3.connect(db_path, timeout=30)
+    try:
+        db.execute("INSERT OR IGNORE INTO AM_SUBSCRIBER (USER_ID) VALUES (?)", (username,))
+        subscriber_id = db.execute("SELECT SUBSCRIBER_ID FROM AM_SUBSCRIBER WHERE USER_ID = ?",
+                                   (username,)).fetchone()[0]
+        api_ids = [row[0] for row in db.execute("SELECT API_ID FROM AM_API WHERE API_NAME != 'Test'")]
+        for i in range(app_count):
+            cursor = db.execute("INSERT INTO AM_APPLICATION (NAME, SUBSCRIBER_ID, APPLICATION_TIER, CALLBACK_URL, "
+                                "DESCRIPTION) VALUES (?, ?, 'Unlimited', '', ?)",
+                                ('bench_client_%d' % i, subscriber_id, 'benchmark client %d' % i))
+            app_id = cursor.lastrowid
+            consumer_key = uuid.uuid4().hex[:28]
+            db.execute("INSERT INTO IDN_OAUTH_CONSUMER_APPS (CONSUMER_KEY, CONSUMER_SECRET, USERNAME, APP_NAME) "
+                       "VALUES (?, ?, ?, ?)", (consumer_key, uuid.uuid4().hex[:28], username, 'bench_client_%d' % i))
+            db.execute("INSERT INTO AM_APPLICATION_KEY_MAPPING (APPLICATION_ID, CONSUMER_KEY, KEY_TYPE, STATE) "
+                       "VALUES (?, ?, 'PRODUCTION', 'COMPLETED')", (app_id, consumer_key))
+            db.executemany("INSERT INTO AM_SUBSCRIPTION (TIER_ID, API_ID, APPLICATION_ID) VALUES ('Unlimited', ?, ?)",
+                           [(api_id, app_id) for api_id in api_ids])
+        db.commit()
+    finally:
+        db.close()
+
+
+def db_queries():
+    """
+    Number of db queries made so far by the requests of this process, on any thread (the fan-out workers
+    query the db too), as recorded in the service's metrics. The key index's own loading and polling are
+    left out.
+    """
+    from agave_clients.service import metrics
+    return sum(value for name, labels, value in metrics.registry.snapshot()['counters']
+               if name == 'agave_clients_db_queries_total' and
+               not dict(labels).get('operation', '').startswith('key_index_'))
+
+
+class Runner(object):
+    """
+    Drives one scenario for one user from several threads and collects the measurements.
+    """
+    def __init__(self, store, username, app_count, concurrency, requests_per_thread):
+        self.store = store
+        self.username = username
+        self.app_count = app_count
+        self.concurrency = concurrency
+        self.requests_per_thread = requests_per_thread
+        self.headers = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(username + ':' + PASSWORD)}
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def request(self, client, method, path, data=None):
+        kwargs = dict(self.headers)
+        if method == 'delete':
+            # the test client sends the data of a DELETE as the raw body.
+            kwargs['content_type'] = 'application/x-www-form-urlencoded'
+            data = urllib.urlencode(data or {})
+        start = time.time()
+        rsp = getattr(client, method)(path, data=data or {}, **kwargs)
+        elapsed = time.time() - start
+        with self.lock:
+            self.latencies.append(elapsed)
+            if rsp.status_code >= 400:
+                self.errors += 1
+
+    def list_mix(self, client, i, thread):
+        roll = random.random()
+        if roll < 0.8:
+            self.request(client, 'get', '/clients/v2')
+        elif roll < 0.9:
+            self.request(client, 'get', '/clients/v2/bench_client_%d' % random.randrange(self.app_count))
+        else:
+            self.request(client, 'get', '/clients/v2/bench_client_%d/subscriptions' % random.randrange(self.app_count))
+
+    def churn_mix(self, client, i, thread):
+        name = 'bench_churn_%d_%d' % (thread, i)
+        self.request(client, 'post', '/clients/v2', {'clientName': name})
+        self.request(client, 'delete', '/clients/v2/' + name)
+
+    def subscribe_mix(self, client, i, thread):
+        path = '/clients/v2/bench_client_%d/subscriptions' % (thread % self.app_count)
+        self.request(client, 'delete', path, {'apiName': '*'})
+        self.request(client, 'post', path, {'apiName': '*'})
+
+    def run(self, scenario):
+        from django.db import connections
+        from django.test import Client
+        mix = getattr(self, scenario + '_mix')
+
+        def work(thread):
+            client = Client()
+            try:
+                for i in range(self.requests_per_thread):
+                    mix(client, i, thread)
+            finally:
+                for connection in connections.all():
+                    connection.close()
+
+        self.store.reset_stats()
+        queries = db_queries()
+        start = time.time()
+        threads = [threading.Thread(target=work, args=(t,)) for t in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        upstream = sum(self.store.stats.values())
+        queries = db_queries() - queries
+        count = len(self.latencies)
+        return {'requests': count,
+                'errors': self.errors,
+                'seconds': round(elapsed, 3),
+                'requests_per_second': round(count / elapsed, 2) if elapsed else None,
+                'latency_ms': dict((name, round(percentile(self.latencies, p) * 1000, 2))
+                                   for name, p in [('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)]),
+                'upstream_calls_per_request': round(float(upstream) / count, 2) if count else None,
+                'upstream_calls': dict(self.store.stats),
+                'db_queries_per_request': round(float(queries) / count, 2) if count else None}
+
+
+def compare(results, baseline):
+    """
+    Prints the change in p50/p99 latency and throughput of each run relative to a baseline results file.
+    """
+    for key, run in sorted(results['runs'].items()):
+        old = baseline.get('runs', {}).get(key)
+        if not old:
+            continue
+        line = [key]
+        for metric in ['p50', 'p99']:
+            before, after = old['latency_ms'][metric], run['latency_ms'][metric]
+            line.append('%s %.1f -> %.1f ms' % (metric, before, after))
+        line.append('rps %s -> %s' % (old['requests_per_second'], run['requests_per_second']))
+        line.append('upstream/req %s -> %s' % (old['upstream_calls_per_request'], run['upstream_calls_per_request']))
+        print '  '.join(line)
+
+def main():
+    parser = optparse.OptionParser(usage="python -m agave_clients.tests.benchmark [options]")
+    parser.add_option('--scenarios', default=','.join(SCENARIOS), help="Comma separated scenarios to run.")
+    parser.add_option('--app-counts', default='1,10,100,500', help="Comma separated numbers of clients per user.")
+    parser.add_option('--concurrency', type='int', default=4, help="Threads issuing requests.")
+    parser.add_option('--requests', type='int', default=25, help="Requests (or request pairs) per thread.")
+    parser.add_option('--latency', type='float', default=0.02, help="Seconds added to every store call.")
+    parser.add_option('--jitter', type='float', default=0.01, help="Maximum random seconds added on top.")
+    parser.add_option('--output', default='benchmark.json', help="File to write the JSON results to.")
+    parser.add_option('--compare', help="Results file of a previous run to compare against.")
+    options, args = parser.parse_args()
+
+    app_counts = [int(n) for n in options.app_counts.split(',')]
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agave_clients_bench'), 'apim.db')
+    users = dict(('bench_user_%d' % n, PASSWORD) for n in app_counts)
+
+    from agave_clients.tests import fake_store
+    server = fake_store.start(db_path, users=users, latency=options.latency, jitter=options.jitter)
+    for n in app_counts:
+        seed_user(db_path, 'bench_user_%d' % n, n)
+
+    os.environ['fake_store_url'] = server.url
+    os.environ['fake_store_db'] = db_path
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'agave_clients.tests.offline_settings'
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.ALLOWED_HOSTS = ['*']
+
+    results = {'revision': git_revision(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'config': {'concurrency': options.concurrency,
+                          'requests_per_thread': options.requests,
+                          'store_latency': options.latency,
+                          'store_jitter': options.jitter,
+                          'app_counts': app_counts},
+               'runs': {}}
+    for scenario in options.scenarios.split(','):
+        for n in app_counts:
+            runner = Runner(server.store, 'bench_user_%d' % n, n, options.concurrency, options.requests)
+            key = '%s/%d_apps' % (scenario, n)
+            results['runs'][key] = runner.run(scenario)
+            run = results['runs'][key]
+            print '%-22s %6d req  %8.2f req/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  upstream/req %5s  db/req %5s' % (
+                key, run['requests'], run['requests_per_second'], run['latency_ms']['p50'],
+                run['latency_ms']['p95'], run['latency_ms']['p99'], run['upstream_calls_per_request'],
+                run['db_queries_per_request'])
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to", options.output
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+    # the fake store's threads serve the service's keep-alive connections until they are closed.
+    from agave_clients.service.store import get_store_client
+    get_store_client().close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
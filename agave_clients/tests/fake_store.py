@@ -0,0 +1,451 @@
+'''
+Stand-in for the WSO2 APIM store and its MySQL database, for running the clients service, its test suite
+and benchmarks on a single machine with no network.
+
+The server implements the store .jag endpoints configured in agave_clients/settings.py (login, the
+application list/add/remove calls, the subscription add/remove/list calls and generateApplicationKey) and
+keeps its data in a SQLite database with the APIM tables the service reads directly
+(AM_SUBSCRIBER, AM_APPLICATION, AM_APPLICATION_KEY_MAPPING and IDN_OAUTH_CONSUMER_APPS). Point the
+service at the same SQLite file with agave_clients.tests.offline_settings.
+
+Every store call can be slowed down with a fixed latency plus random jitter to mimic a remote APIM.
+The number of calls per action is reported at /_stats (and reset with a POST to /_stats).
+
+Usage:
+    python -m agave_clients.tests.fake_store --port 9443 --db /tmp/agave_clients_apim.db --latency 0.05
+
+then, in another shell:
+    fake_store_url=http://127.0.0.1:9443 fake_store_db=/tmp/agave_clients_apim.db \
+        python manage.py runserver 127.0.0.1:9000 --settings=agave_clients.tests.offline_settings
+'''
+
+import BaseHTTPServer
+from collections import defaultdict
+import Cookie
+import json
+import optparse
+import random
+import SocketServer
+import sqlite3
+import threading
+import time
+import urlparse
+import uuid
+
+
+STORE_PREFIX = '/store/site/blocks'
+STORE_AUTH_URL = "/user/login/ajax/login.jag"
+STORE_SUBSCRIPTION_URL = '/subscription/subscription-add/ajax/subscription-add.jag'
+STORE_REMOVE_SUB_URL = '/subscription/subscription-remove/ajax/subscription-remove.jag'
+STORE_LIST_SUBS_URL = '/subscription/subscription-list/ajax/subscription-list.jag'
+STORE_APPS_URL = "/application/application-list/ajax/application-list.jag"
+STORE_ADD_APP_URL = "/application/application-add/ajax/application-add.jag"
+STORE_REMOVE_APP_URL = "/application/application-remove/ajax/application-remove.jag"
+
+AGAVE_API_VERSION = 'v2'
+DEFAULT_APIS = [(name, AGAVE_API_VERSION, 'admin') for name in ['Apps', 'Files', 'Jobs', 'Meta', 'Monitors',
+                                                                'Notifications', 'Postits', 'Profiles',
+                                                                'Systems', 'Transforms']]
+# the API used by the test suite's subscription tests.
+DEFAULT_APIS.append(('Test', 'v0.1', 'admin'))
+DEFAULT_USERS = {'jdoe': 'abcde'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS AM_SUBSCRIBER (
+    SUBSCRIBER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    USER_ID VARCHAR(255) NOT NULL UNIQUE,
+    TENANT_ID INTEGER NOT NULL DEFAULT -1234
+);
+CREATE TABLE IF NOT EXISTS AM_APPLICATION (
+    APPLICATION_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    NAME VARCHAR(100),
+    SUBSCRIBER_ID INTEGER REFERENCES AM_SUBSCRIBER (SUBSCRIBER_ID),
+    APPLICATION_TIER VARCHAR(50) DEFAULT 'Unlimited',
+    CALLBACK_URL VARCHAR(512),
+    DESCRIPTION VARCHAR(512),
+    APPLICATION_STATUS VARCHAR(50) DEFAULT 'APPROVED',
+    GROUP_ID VARCHAR(100),
+    UNIQUE (NAME, SUBSCRIBER_ID)
+);
+CREATE TABLE IF NOT EXISTS AM_APPLICATION_KEY_MAPPING (
+    APPLICATION_ID INTEGER NOT NULL,
+    CONSUMER_KEY VARCHAR(255),
+    KEY_TYPE VARCHAR(512) NOT NULL,
+    STATE VARCHAR(30),
+    PRIMARY KEY (APPLICATION_ID, KEY_TYPE)
+);
+CREATE TABLE IF NOT EXISTS IDN_OAUTH_CONSUMER_APPS (
+    CONSUMER_KEY VARCHAR(255) PRIMARY KEY,
+    CONSUMER_SECRET VARCHAR(512),
+    USERNAME VARCHAR(255),
+    TENANT_ID INTEGER DEFAULT -1234,
+    APP_NAME VARCHAR(255),
+    OAUTH_VERSION VARCHAR(128) DEFAULT 'OAuth-2.0',
+    CALLBACK_URL VARCHAR(1024),
+    LOGIN_PAGE_URL VARCHAR(1024),
+    ERROR_PAGE_URL VARCHAR(1024),
+    CONSENT_PAGE_URL VARCHAR(1024),
+    GRANT_TYPES VARCHAR(1024)
+);
+CREATE TABLE IF NOT EXISTS AM_API (
+    API_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    API_PROVIDER VARCHAR(256),
+    API_NAME VARCHAR(256),
+    API_VERSION VARCHAR(30),
+    CONTEXT VARCHAR(256),
+    UNIQUE (API_PROVIDER, API_NAME, API_VERSION)
+);
+CREATE TABLE IF NOT EXISTS AM_SUBSCRIPTION (
+    SUBSCRIPTION_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    TIER_ID VARCHAR(50),
+    API_ID INTEGER REFERENCES AM_API (API_ID),
+    APPLICATION_ID INTEGER REFERENCES AM_APPLICATION (APPLICATION_ID),
+    SUB_STATUS VARCHAR(50) DEFAULT 'UNBLOCKED',
+    UNIQUE (API_ID, APPLICATION_ID)
+);
+"""
+
+
+class FakeStore(object):
+    """
+    The state of the fake store: its database, users, sessions and call statistics.
+    """
+    def __init__(self, db_path, users=None, apis=None, latency=0.0, jitter=0.0):
+        self.db_path = db_path
+        self.users = users if users is not None else dict(DEFAULT_USERS)
+        self.latency = latency
+        self.jitter = jitter
+        self.sessions = {}
+        self.stats = defaultdict(int)
+        self.lock = threading.RLock()
+        db = self.connect()
+        try:
+            db.executescript(SCHEMA)
+            for name, version, provider in (apis if apis is not None else DEFAULT_APIS):
+                db.execute("INSERT OR IGNORE INTO AM_API (API_PROVIDER, API_NAME, API_VERSION, CONTEXT) "
+                           "VALUES (?, ?, ?, ?)", (provider, name, version, '/' + name.lower() + '/' + version))
+            db.commit()
+        finally:
+            db.close()
+
+    def connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def count(self, action):
+        with self.lock:
+            self.stats[action] += 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+
+    # -------
+    # Actions
+    # -------
+
+    def login(self, db, parms):
+        username = parms.get('username')
+        if not username or self.users.get(username) != parms.get('password'):
+            return {'error': True, 'message': 'Invalid username or password'}, None
+        subscriber_id = self.subscriber_id(db, username)
+        # like WSO2, every subscriber has a DefaultApplication (without keys).
+        db.execute("INSERT OR IGNORE INTO AM_APPLICATION (NAME, SUBSCRIBER_ID, DESCRIPTION) VALUES (?, ?, ?)",
+                   ('DefaultApplication', subscriber_id, 'This is the default application'))
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = username
+        return {'error': False}, session_id
+
+    def subscriber_id(self, db, username):
+        db.execute("INSERT OR IGNORE INTO AM_SUBSCRIBER (USER_ID) VALUES (?)", (username,))
+        return db.execute("SELECT SUBSCRIBER_ID FROM AM_SUBSCRIBER WHERE USER_ID = ?",
+                          (username,)).fetchone()[0]
+
+    def application(self, db, username, name):
+        return db.execute("SELECT a.* FROM AM_APPLICATION a JOIN AM_SUBSCRIBER s "
+                          "ON a.SUBSCRIBER_ID = s.SUBSCRIBER_ID WHERE s.USER_ID = ? AND a.NAME = ?",
+                          (username, name)).fetchone()
+
+    def api(self, db, parms):
+        return db.execute("SELECT * FROM AM_API WHERE API_NAME = ? AND API_VERSION = ? AND API_PROVIDER = ?",
+                          (parms.get('name'), parms.get('version'), parms.get('provider'))).fetchone()
+
+    def get_applications(self, db, username, parms):
+        rows = db.execute("SELECT a.*, (SELECT COUNT(*) FROM AM_SUBSCRIPTION sub "
+                          "WHERE sub.APPLICATION_ID = a.APPLICATION_ID) AS API_COUNT "
+                          "FROM AM_APPLICATION a JOIN AM_SUBSCRIBER s ON a.SUBSCRIBER_ID = s.SUBSCRIBER_ID "
+                          "WHERE s.USER_ID = ? ORDER BY a.APPLICATION_ID", (username,)).fetchall()
+        return {'error': False,
+                'applications': [{'id': row['APPLICATION_ID'],
+                                  'name': row['NAME'],
+                                  'tier': row['APPLICATION_TIER'],
+                                  'status': row['APPLICATION_STATUS'],
+                                  'callbackUrl': row['CALLBACK_URL'] or '',
+                                  'description': row['DESCRIPTION'],
+                                  'groupId': row['GROUP_ID'] or '',
+                                  'apiCount': row['API_COUNT']} for row in rows]}
+
+    def add_application(self, db, username, parms):
+        name = parms.get('application')
+        if not name:
+            return {'error': True, 'message': 'Application name is required'}
+        if self.application(db, username, name):
+            return {'error': True, 'message': 'A duplicate application already exists by the name - ' + name}
+        db.execute("INSERT INTO AM_APPLICATION (NAME, SUBSCRIBER_ID, APPLICATION_TIER, CALLBACK_URL, DESCRIPTION) "
+                   "VALUES (?, ?, ?, ?, ?)", (name, self.subscriber_id(db, username), parms.get('tier'),
+                                              parms.get('callbackUrl'), parms.get('description')))
+        return {'error': False}
+
+    def remove_application(self, db, username, parms):
+        app = self.application(db, username, parms.get('application'))
+        if not app:
+            return {'error': True, 'message': 'Application not found'}
+        app_id = app['APPLICATION_ID']
+        for row in db.execute("SELECT CONSUMER_KEY FROM AM_APPLICATION_KEY_MAPPING WHERE APPLICATION_ID = ?",
+                              (app_id,)).fetchall():
+            db.execute("DELETE FROM IDN_OAUTH_CONSUMER_APPS WHERE CONSUMER_KEY = ?", (row[0],))
+        db.execute("DELETE FROM AM_APPLICATION_KEY_MAPPING WHERE APPLICATION_ID = ?", (app_id,))
+        db.execute("DELETE FROM AM_SUBSCRIPTION WHERE APPLICATION_ID = ?", (app_id,))
+        db.execute("DELETE FROM AM_APPLICATION WHERE APPLICATION_ID = ?", (app_id,))
+        return {'error': False}
+
+    def add_subscription(self, db, username, parms):
+        app = self.application(db, username, parms.get('applicationName'))
+        if not app:
+            return {'error': True, 'message': 'Application not found'}
+        api = self.api(db, parms)
+        if not api:
+            return {'error': True, 'message': 'API not found'}
+        if db.execute("SELECT 1 FROM AM_SUBSCRIPTION WHERE API_ID = ? AND APPLICATION_ID = ?",
+                      (api['API_ID'], app['APPLICATION_ID'])).fetchone():
+            return {'error': True, 'message': 'Subscription already exists'}
+        db.execute("INSERT INTO AM_SUBSCRIPTION (TIER_ID, API_ID, APPLICATION_ID) VALUES (?, ?, ?)",
+                   (parms.get('tier') or 'Unlimited', api['API_ID'], app['APPLICATION_ID']))
+        return {'error': False, 'status': 'UNBLOCKED'}
+
+    def remove_subscription(self, db, username, parms):
+        app = self.application(db, username, parms.get('applicationName'))
+        api = self.api(db, parms)
+        if not app or not api:
+            return {'error': True, 'message': 'Subscription not found'}
+        db.execute("DELETE FROM AM_SUBSCRIPTION WHERE API_ID = ? AND APPLICATION_ID = ?",
+                   (api['API_ID'], app['APPLICATION_ID']))
+        return {'error': False}
+
+    def generate_key(self, db, username, parms):
+        app = self.application(db, username, parms.get('application'))
+        if not app:
+            return {'error': True, 'message': 'Application not found'}
+        key_type = parms.get('keytype', 'PRODUCTION')
+        if db.execute("SELECT 1 FROM AM_APPLICATION_KEY_MAPPING WHERE APPLICATION_ID = ? AND KEY_TYPE = ?",
+                      (app['APPLICATION_ID'], key_type)).fetchone():
+            return {'error': True, 'message': 'Keys already generated for ' + app['NAME']}
+        consumer_key = uuid.uuid4().hex[:28]
+        consumer_secret = uuid.uuid4().hex[:28]
+        db.execute("INSERT INTO IDN_OAUTH_CONSUMER_APPS (CONSUMER_KEY, CONSUMER_SECRET, USERNAME, APP_NAME, "
+                   "CALLBACK_URL, GRANT_TYPES) VALUES (?, ?, ?, ?, ?, ?)",
+                   (consumer_key, consumer_secret, username, username + '_' + app['NAME'] + '_' + key_type,
+                    parms.get('callbackUrl', ''), 'refresh_token password client_credentials'))
+        db.execute("INSERT INTO AM_APPLICATION_KEY_MAPPING (APPLICATION_ID, CONSUMER_KEY, KEY_TYPE, STATE) "
+                   "VALUES (?, ?, ?, ?)", (app['APPLICATION_ID'], consumer_key, key_type, 'COMPLETED'))
+        return {'error': False,
+                'data': {'key': {'consumerKey': consumer_key,
+                                 'consumerSecret': consumer_secret,
+                                 'accessToken': uuid.uuid4().hex,
+                                 'validityTime': parms.get('validityTime', '3600'),
+                                 'accessallowdomains': parms.get('authorizedDomains', 'ALL'),
+                                 'enableRegenarate': True,
+                                 'keyState': 'COMPLETED',
+                                 'appDetails': '{}'}}}
+
+    def get_subscriptions(self, db, username, parms):
+        # like WSO2, the subscriptions of all of the user's applications are returned.
+        apps = self.get_applications(db, username, parms)['applications']
+        result = []
+        for app in apps:
+            rows = db.execute("SELECT sub.*, api.* FROM AM_SUBSCRIPTION sub JOIN AM_API api "
+                              "ON sub.API_ID = api.API_ID WHERE sub.APPLICATION_ID = ? ORDER BY api.API_NAME",
+                              (app['id'],)).fetchall()
+            key = db.execute("SELECT CONSUMER_KEY FROM AM_APPLICATION_KEY_MAPPING WHERE APPLICATION_ID = ? "
+                             "AND KEY_TYPE = 'PRODUCTION'", (app['id'],)).fetchone()
+            result.append({'id': app['id'],
+                           'name': app['name'],
+                           'subscriptions': [{'name': row['API_NAME'],
+                                              'provider': row['API_PROVIDER'],
+                                              'version': row['API_VERSION'],
+                                              'context': row['CONTEXT'],
+                                              'status': 'PUBLISHED',
+                                              'tier': row['TIER_ID'],
+                                              'subStatus': row['SUB_STATUS'],
+                                              'thumburl': '',
+                                              'hasMultipleEndpoints': 'false',
+                                              'prodKey': None,
+                                              'prodConsumerKey': key[0] if key else None,
+                                              'prodConsumerSecret': None,
+                                              'prodAuthorizedDomains': 'ALL',
+                                              'prodValidityTime': 3600,
+                                              'prodValidityRemainingTime': 3600,
+                                              'sandboxKey': None,
+                                              'sandboxConsumerKey': None,
+                                              'sandboxConsumerSecret': None,
+                                              'sandAuthorizedDomains': None,
+                                              'sandValidityTime': 3600,
+                                              'sandValidityRemainingTime': 3600} for row in rows]})
+        return {'error': False, 'subscriptions': {'applications': result, 'totalLength': len(result)}}
+
+    # -------
+    # Routing
+    # -------
+
+    ACTIONS = {
+        (STORE_APPS_URL, 'getApplications'): get_applications,
+        (STORE_ADD_APP_URL, 'addApplication'): add_application,
+        (STORE_REMOVE_APP_URL, 'removeApplication'): remove_application,
+        (STORE_SUBSCRIPTION_URL, 'addAPISubscription'): add_subscription,
+        (STORE_SUBSCRIPTION_URL, 'generateApplicationKey'): generate_key,
+        (STORE_REMOVE_SUB_URL, 'removeSubscription'): remove_subscription,
+        (STORE_LIST_SUBS_URL, 'getAllSubscriptions'): get_subscriptions,
+    }
+
+    def dispatch(self, path, parms, session_id):
+        """
+        Handles a store call; returns the JSON body and, for logins, the id of the new session.
+        """
+        action = parms.get('action')
+        self.count(action or path)
+        self.delay()
+        db = self.connect()
+        try:
+            with self.lock:
+                if path == STORE_AUTH_URL and action == 'login':
+                    rsp = self.login(db, parms)
+                else:
+                    username = self.sessions.get(session_id)
+                    handler = self.ACTIONS.get((path, action))
+                    if not handler:
+                        rsp = {'error': True, 'message': 'Unsupported action ' + str(action)}, None
+                    elif not username:
+                        rsp = {'error': True, 'message': 'timeout'}, None
+                    else:
+                        rsp = handler(self, db, username, parms), None
+                db.commit()
+            return rsp
+        finally:
+            db.close()
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, so that the service's connection pool behaves as it would against APIM.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_json(self, body, session_id=None):
+        content = json.dumps(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if session_id:
+            self.send_header('Set-Cookie', 'JSESSIONID=' + session_id + '; Path=/store')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_call(self, body=''):
+        store = self.server.store
+        url = urlparse.urlparse(self.path)
+        if url.path == '/_stats':
+            if self.command == 'POST':
+                store.reset_stats()
+            return self.send_json(dict(store.stats))
+        if not url.path.startswith(STORE_PREFIX):
+            self.send_error(404)
+            return
+        parms = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).items())
+        parms.update(dict((k, v[-1]) for k, v in urlparse.parse_qs(body).items()))
+        cookies = Cookie.SimpleCookie(self.headers.get('Cookie', ''))
+        session_id = cookies['JSESSIONID'].value if 'JSESSIONID' in cookies else None
+        rsp, new_session = store.dispatch(url.path[len(STORE_PREFIX):], parms, session_id)
+        self.send_json(rsp, new_session)
+
+    def do_GET(self):
+        self.handle_call()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.handle_call(self.rfile.read(length) if length else '')
+
+
+class FakeStoreServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, store, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.store = store
+        self.verbose = verbose
+        self.handlers = []
+        self.handlers_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        # as ThreadingMixIn does, keeping track of the threads so that stop() can wait for them.
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = self.daemon_threads
+        with self.handlers_lock:
+            self.handlers = [t for t in self.handlers if t.is_alive()] + [thread]
+        thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Stops serving and waits up to timeout seconds for each thread handling a connection to finish, so
+        that none is left running as the interpreter exits. Clients should close their keep-alive
+        connections first.
+        """
+        self.shutdown()
+        self.server_close()
+        with self.handlers_lock:
+            handlers = list(self.handlers)
+        for thread in handlers:
+            thread.join(timeout)
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self.server_address
+
+def start(db_path, host='127.0.0.1', port=0, **kwargs):
+    """
+    Starts a fake store on a background thread and returns the server; port=0 picks a free port. The
+    server's url attribute is the value to use for the fake_store_url environment variable.
+    """
+    server = FakeStoreServer((host, port), FakeStore(db_path, **kwargs))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def main():
+    parser = optparse.OptionParser(usage="python -m agave_clients.tests.fake_store [options]")
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=9443)
+    parser.add_option('--db', default='/tmp/agave_clients_apim.db', help="SQLite database file.")
+    parser.add_option('--latency', type='float', default=0.0, help="Seconds added to every store call.")
+    parser.add_option('--jitter', type='float', default=0.0, help="Maximum random seconds added on top.")
+    parser.add_option('--user', action='append', default=[], help="username:password; may be repeated.")
+    parser.add_option('--verbose', action='store_true', default=False)
+    options, args = parser.parse_args()
+    users = dict(user.split(':', 1) for user in options.user) or None
+    store = FakeStore(options.db, users=users, latency=options.latency, jitter=options.jitter)
+    server = FakeStoreServer((options.host, options.port), store, verbose=options.verbose)
+    print "Fake APIM store listening on", server.url, "with database", options.db
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+'''
+Start up benchmark: measures how long a new process takes to load the clients service, in the manner of
+python -X importtime (which Python 2 lacks). Each run starts a fresh interpreter that imports the settings,
+sets Django up, builds the URLconf (importing the views) and creates the WSGI application, as mod_wsgi does
+before a process can serve its first request. Store and db connections are not opened.
+
+For each settings module it reports the median time over the runs, the number of modules loaded and the
+imports taking the longest (self time excludes the imports they triggered), and writes them to a JSON file
+that can be compared across commits:
+
+    python -m agave_clients.tests.importtime --output before.json
+    ... change the code ...
+    python -m agave_clients.tests.importtime --output after.json --compare before.json
+'''
+
+import __builtin__
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+
+SETTINGS_MODULES = ['agave_clients.settings', 'agave_clients.api_settings']
+
+
+def time_imports(timings):
+    """
+    Wraps the import statement so that the self and cumulative time of every import that loads at least one
+    new module is added to timings, a dict mapping module name to [self seconds, cumulative seconds].
+    """
+    original = __builtin__.__import__
+    # seconds spent in nested imports, per import in progress.
+    nested = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=None, level=-1):
+        loaded = len(sys.modules)
+        nested.append(0.0)
+        start = time.time()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            if len(sys.modules) > loaded:
+                timing = timings.setdefault(name, [0.0, 0.0])
+                timing[0] += elapsed - children
+                timing[1] += elapsed
+
+    __builtin__.__import__ = timed_import
+
+def child(settings_module, top):
+    """
+    Loads the service in this process and prints the timings as JSON.
+    """
+    timings = {}
+    start = time.time()
+    time_imports(timings)
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    import django
+    django.setup()
+    from django.core.urlresolvers import get_resolver
+    get_resolver(None).url_patterns
+    from django.core.wsgi import get_wsgi_application
+    get_wsgi_application()
+    elapsed = time.time() - start
+    slowest = sorted(timings.items(), key=lambda item: -item[1][1])[:top]
+    print json.dumps({'seconds': elapsed,
+                      'modules': len(sys.modules),
+                      'imports': [{'module': name,
+                                   'self_ms': round(t[0] * 1000, 2),
+                                   'cumulative_ms': round(t[1] * 1000, 2)} for name, t in slowest]})
+
+def measure(settings_module, runs, top):
+    """
+    Loads the service in runs fresh processes; returns the results of the median run.
+    """
+    from agave_clients.tests.benchmark import percentile
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-m', 'agave_clients.tests.importtime',
+                                          '--child', settings_module, '--top', str(top)])
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    median = percentile([r['seconds'] for r in results], 50)
+    result = [r for r in results if r['seconds'] == median][0]
+    return {'seconds': round(median, 3),
+            'min_seconds': round(min(r['seconds'] for r in results), 3),
+            'modules': result['modules'],
+            'imports': result['imports']}
+
+def compare(results, baseline):
+    """
+    Prints the change in start up time and modules loaded relative to a baseline results file.
+    """
+    for key, run in sorted(results['runs'].items()):
+        old = baseline.get('runs', {}).get(key)
+        if old:
+            print '%-30s %.3f -> %.3f s  modules %d -> %d' % (key, old['seconds'], run['seconds'],
+                                                             old['modules'], run['modules'])
+
+def main():
+    parser = optparse.OptionParser(usage="python -m agave_clients.tests.importtime [options]")
+    parser.add_option('--settings', default=','.join(SETTINGS_MODULES),
+                      help="Comma separated settings modules to measure.")
+    parser.add_option('--runs', type='int', default=5, help="Processes started per settings module.")
+    parser.add_option('--top', type='int', default=15, help="Number of slowest imports to report.")
+    parser.add_option('--output', default='importtime.json', help="File to write the JSON results to.")
+    parser.add_option('--compare', help="Results file of a previous run to compare against.")
+    parser.add_option('--child', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    if options.child:
+        # the child must not import anything it doesn't measure.
+        child(options.child, options.top)
+        return
+
+    from agave_clients.tests.benchmark import git_revision
+
+    results = {'revision': git_revision(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'config': {'runs': options.runs, 'python': sys.version.split()[0]},
+               'runs': {}}
+    for settings_module in options.settings.split(','):
+        run = results['runs'][settings_module] = measure(settings_module, options.runs, options.top)
+        print '%-30s %.3f s (min %.3f s)  %d modules' % (settings_module, run['seconds'], run['min_seconds'],
+                                                         run['modules'])
+        for entry in run['imports']:
+            print '    %10.2f ms  %10.2f ms  %s' % (entry['cumulative_ms'], entry['self_ms'], entry['module'])
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to", options.output
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+# Settings for running the clients service against the fake APIM store in agave_clients.tests.fake_store,
+# with no network access. Start the fake store first, then e.g.:
+#     python manage.py runserver 127.0.0.1:9000 --settings=agave_clients.tests.offline_settings
+import os
+
+from agave_clients.settings import *
+
+
+# The fake store speaks plain http.
+APIM_STORE_SERVICES_BASE_URL = os.environ.get('fake_store_url', 'http://127.0.0.1:9443') + '/store/site/blocks'
+
+DATABASES = {
+    # The same SQLite file the fake store was started with.
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('fake_store_db', '/tmp/agave_clients_apim.db'),
+        'USE_LIVE_FOR_TESTS': True,
+    },
+}
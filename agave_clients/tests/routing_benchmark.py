@@ -0,0 +1,104 @@
+'''
+Benchmark of URL resolution for the client routes as the length of the client name grows. For every
+route and client name length it reports the microseconds taken to resolve a path with the URLconf and,
+for comparison, with a Django resolver built from the URL patterns used before the clients API got a
+dedicated resolver (unanchored, with the format suffixes rest_framework adds). Both are timed through
+RegexURLResolver.resolve, as Django resolves a request.
+
+    python -m agave_clients.tests.routing_benchmark --output after.json --compare before.json
+'''
+
+import json
+import optparse
+import os
+import time
+
+
+# The routes of the clients API as they were matched before agave_clients.service.routing, in order.
+LEGACY_PATTERNS = [
+    r'clients/v2/_metrics/?$',
+    r'clients/v2/_batch/?$',
+    r'clients/v2/(?P<client_name>.*[^/])/provisioning/$',
+    r'clients/v2/(?P<client_name>.*[^/])/provisioning$',
+    r'clients/v2/(?P<client_name>.*[^/])/subscriptions/$',
+    r'clients/v2/(?P<client_name>.*[^/])/subscriptions$',
+    r'clients/v2/(?P<client_name>.*[^/])/$',
+    r'clients/v2/(?P<client_name>.*[^/])$',
+    r'clients/v2/',
+    r'clients/v2',
+]
+
+ROUTES = {'details': '/clients/v2/%s',
+          'subscriptions': '/clients/v2/%s/subscriptions/',
+          'provisioning': '/clients/v2/%s/provisioning'}
+
+
+def legacy_resolver():
+    """
+    A root resolver for the legacy patterns, as Django built it from the URLconf.
+    """
+    from django.conf.urls import url
+    from django.core.urlresolvers import RegexURLResolver
+    from rest_framework.urlpatterns import format_suffix_patterns
+
+    view = lambda request, **kwargs: None
+    return RegexURLResolver(r'^/', format_suffix_patterns([url(p, view) for p in LEGACY_PATTERNS]))
+
+def per_call(function, path, iterations):
+    """
+    Microseconds per call of function(path), over iterations calls.
+    """
+    start = time.time()
+    for _ in range(iterations):
+        function(path)
+    return (time.time() - start) / iterations * 1e6
+
+def compare(results, baseline):
+    for key, run in sorted(results['runs'].items()):
+        old = baseline.get('runs', {}).get(key)
+        if old:
+            print '%-26s %10.2f -> %10.2f us' % (key, old['urlconf_us'], run['urlconf_us'])
+
+def main():
+    parser = optparse.OptionParser(usage="python -m agave_clients.tests.routing_benchmark [options]")
+    parser.add_option('--lengths', default='8,64,512,4096', help="Comma separated client name lengths.")
+    parser.add_option('--iterations', type='int', default=200, help="Resolutions timed per path.")
+    parser.add_option('--output', default='routing_benchmark.json', help="File to write the JSON results to.")
+    parser.add_option('--compare', help="Results file of a previous run to compare against.")
+    options, args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agave_clients.settings')
+    import django
+    django.setup()
+    from django.core.urlresolvers import resolve
+    from agave_clients.tests.benchmark import git_revision
+    legacy_resolve = legacy_resolver().resolve
+
+    results = {'revision': git_revision(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'config': {'iterations': options.iterations},
+               'runs': {}}
+    for route, template in sorted(ROUTES.items()):
+        for length in [int(n) for n in options.lengths.split(',')]:
+            # slashes in the name are allowed, and are the worst case for the legacy patterns.
+            name = (('client-%d/' % length) * length)[:length].rstrip('/')
+            # request paths reach the resolvers decoded, as unicode.
+            path = unicode(template % name)
+            match = resolve(path)
+            assert match.kwargs['client_name'] == name, (path, match.kwargs)
+            assert legacy_resolve(path).kwargs['client_name'] == name, path
+            key = '%s/%d' % (route, length)
+            run = results['runs'][key] = {'urlconf_us': round(per_call(resolve, path, options.iterations), 2),
+                                          'legacy_us': round(per_call(legacy_resolve, path, options.iterations), 2)}
+            print '%-26s urlconf %10.2f us  legacy patterns %10.2f us' % (key, run['urlconf_us'], run['legacy_us'])
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to", options.output
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,7 @@ import json
 import base64
 import pytest
 import requests
+import time
 
 
 BASE_URL = os.environ.get('base_url', 'http://127.0.0.1:9000')
@@ -61,6 +62,24 @@ def client_attrs():
                     'description': 'agave_clients testsuite client.'}
     return client_attrs
 
+@pytest.fixture(scope='session')
+def async_client_attrs():
+    """Return attributes for the test client provisioned asynchronously."""
+    return {'clientName': 'agave_clients_testsuite_async_client',
+            'description': 'agave_clients testsuite async client.',
+            'async': 'true'}
+
+@pytest.fixture(scope='session')
+def batch_client_names():
+    """Return the names of the test clients created and deleted in a batch."""
+    return ['agave_clients_testsuite_batch_client_{}'.format(i) for i in range(3)]
+
+@pytest.fixture(scope='session')
+def slash_client_attrs():
+    """Return attributes for the test client with slashes in its name."""
+    return {'clientName': 'agave_clients_testsuite/slash/client',
+            'description': 'agave_clients testsuite client with slashes in its name.'}
+
 @pytest.fixture(scope='session')
 def sub_attrs():
     """Return attributes for the test subscription."""
@@ -139,6 +158,75 @@ def test_create_client(headers, client_attrs):
     client = validate_response(rsp)
     validate_client(client, secret_present=True)
 
+def test_cors_preflight():
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.options(url, headers={'Origin': 'https://portal.example.com',
+                                         'Access-Control-Request-Method': 'GET',
+                                         'Access-Control-Request-Headers': 'authorization, if-none-match'})
+    # answered without credentials, before the view.
+    assert rsp.status_code == 200
+    assert rsp.headers['access-control-max-age'] == '86400'
+    assert 'if-none-match' in rsp.headers['access-control-allow-headers']
+    assert 'server-timing' not in rsp.headers
+
+def test_metrics(headers):
+    url = '{}/clients/v2/_metrics'.format(BASE_URL)
+    rsp = requests.get(url)
+    assert rsp.status_code == 200
+    assert 'text/plain' in rsp.headers['content-type']
+    assert '# TYPE agave_clients_store_calls_total counter' in rsp.content
+    assert 'endpoint="STORE_APPS_URL"' in rsp.content
+
+def test_list_clients_invalidated_by_create(headers, client_attrs):
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.get(url, headers=headers)
+    clients = validate_response(rsp)
+    assert rsp.headers['X-Cache'] == 'MISS'
+    assert client_attrs.get('clientName') in [client.get('name') for client in clients]
+
+def test_list_clients_cached(headers):
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.get(url, headers=headers)
+    validate_response(rsp)
+    assert rsp.headers['X-Cache'] == 'HIT'
+
+def test_list_clients_not_modified(headers):
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.get(url, headers=headers)
+    validate_response(rsp)
+    etag = rsp.headers['etag']
+    rsp = requests.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert rsp.status_code == 304
+    assert rsp.headers['etag'] == etag
+    # another representation of the listing has another etag:
+    rsp = requests.get(url, headers=dict(headers, **{'If-None-Match': etag}), params={'limit': 1})
+    validate_response(rsp)
+
+def test_list_clients_paginated(headers):
+    url = '{}/clients/v2'.format(BASE_URL)
+    clients = validate_response(requests.get(url, headers=headers))
+    rsp = requests.get(url, headers=headers, params={'offset': 1, 'limit': 1})
+    page = validate_response(rsp)
+    assert [c.get('name') for c in page] == [c.get('name') for c in clients[1:2]]
+    rsp = requests.get(url, headers=headers, params={'limit': 'abc'})
+    assert rsp.status_code == 400
+
+def test_list_clients_streamed(headers):
+    url = '{}/clients/v2'.format(BASE_URL)
+    clients = validate_response(requests.get(url, headers=headers))
+    rsp = requests.get(url, headers=headers, params={'stream': 'true'})
+    streamed = validate_response(rsp)
+    assert [c.get('name') for c in streamed] == [c.get('name') for c in clients]
+    for client in streamed:
+        validate_client(client)
+
+def test_server_timing(headers):
+    # after the listing cache tests: this request fills the cache.
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.get(url, headers=headers)
+    validate_response(rsp)
+    assert 'total;dur=' in rsp.headers['server-timing']
+
 def test_list_client_details(headers, client_attrs):
     url = '{}/clients/v2/{}'.format(BASE_URL, client_attrs.get('clientName'))
     rsp = requests.get(url, headers=headers)
@@ -159,11 +247,35 @@ def test_list_subscriptions(headers, client_attrs):
     for api in AGAVE_APIS:
         assert api.get('name') in [sub.get('apiName') for sub in subs]
 
+def test_list_subscriptions_streamed(headers, client_attrs):
+    url = '{}/clients/v2/{}/subscriptions'.format(BASE_URL, client_attrs.get('clientName'))
+    rsp = requests.get(url, headers=headers, params={'stream': 'true', 'limit': 2})
+    subs = validate_response(rsp)
+    assert len(subs) <= 2
+    for sub in subs:
+        validate_subscription(sub)
+
 def test_add_subscription(headers, client_attrs, sub_attrs):
     url = '{}/clients/v2/{}/subscriptions'.format(BASE_URL, client_attrs.get('clientName'))
     rsp = requests.post(url, data=sub_attrs, headers=headers)
     validate_response(rsp)
 
+def test_subscriptions_etag_changes(headers, client_attrs, sub_attrs):
+    url = '{}/clients/v2/{}/subscriptions'.format(BASE_URL, client_attrs.get('clientName'))
+    rsp = requests.get(url, headers=headers)
+    validate_response(rsp)
+    etag = rsp.headers['etag']
+    rsp = requests.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert rsp.status_code == 304
+    rsp = requests.delete(url, data={'apiName': sub_attrs['apiName'], 'apiVersion': sub_attrs['apiVersion'],
+                                     'apiProvider': sub_attrs['apiProvider']}, headers=headers)
+    validate_response(rsp)
+    rsp = requests.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    validate_response(rsp)
+    assert rsp.headers['etag'] != etag
+    rsp = requests.post(url, data=sub_attrs, headers=headers)
+    validate_response(rsp)
+
 def test_ensure_added_subscription_present(headers, client_attrs, sub_attrs):
     url = '{}/clients/v2/{}/subscriptions'.format(BASE_URL, client_attrs.get('clientName'))
     rsp = requests.get(url, headers=headers)
@@ -237,3 +349,115 @@ def test_ensure_deleted_client_gone(headers, client_attrs):
         if client.get('name') == client_attrs.get('clientName'):
             assert False
 
+def test_create_client_async(headers, async_client_attrs):
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.post(url, data=async_client_attrs, headers=headers)
+    assert rsp.status_code == 202
+    job = json.loads(rsp.content)['result']
+    assert job['clientName'] == async_client_attrs.get('clientName')
+    assert '/provisioning' in rsp.headers['location']
+
+def test_provisioning_status(headers, async_client_attrs):
+    url = '{}/clients/v2/{}/provisioning'.format(BASE_URL, async_client_attrs.get('clientName'))
+    for i in range(60):
+        rsp = requests.get(url, headers=headers)
+        job = validate_response(rsp)
+        assert [step['name'] for step in job['steps']][:2] == ['add_application', 'generate_credentials']
+        if job['status'] in ('COMPLETE', 'FAILED'):
+            break
+        time.sleep(1)
+    assert job['status'] == 'COMPLETE'
+    # no callbackUrl was given:
+    assert job['steps'][-1] == {'name': 'update_callback_url', 'status': 'SKIPPED', 'message': None}
+    validate_client(job['result'], secret_present=True)
+    # the secret is only ever delivered once:
+    rsp = requests.get(url, headers=headers)
+    job = validate_response(rsp)
+    validate_client(job['result'])
+
+def test_delete_async_client(headers, async_client_attrs):
+    url = '{}/clients/v2/{}'.format(BASE_URL, async_client_attrs.get('clientName'))
+    rsp = requests.delete(url, headers=headers)
+    validate_response(rsp)
+
+def test_create_clients_batch(headers, batch_client_names):
+    url = '{}/clients/v2/_batch'.format(BASE_URL)
+    body = {'create': [{'clientName': name, 'description': 'agave_clients testsuite batch client.'}
+                       for name in batch_client_names] + [batch_client_names[0]]}
+    rsp = requests.post(url, data=json.dumps(body), headers=dict(headers, **{'content-type': 'application/json'}))
+    results = validate_response(rsp)
+    assert len(results) == len(batch_client_names) + 1
+    # the duplicate is rejected, the others are created with their secret:
+    failed = [r for r in results if r['status'] == 'error']
+    assert len(failed) == 1
+    assert failed[0]['clientName'] == batch_client_names[0]
+    for result in results:
+        if result['status'] == 'success':
+            assert result['action'] == 'create'
+            validate_client(result['result'], secret_present=True)
+
+def test_create_clients_batch_invalid_name(headers):
+    url = '{}/clients/v2/_batch'.format(BASE_URL)
+    rsp = requests.post(url, data=json.dumps({'create': [{'clientName': 5}]}),
+                        headers=dict(headers, **{'content-type': 'application/json'}))
+    assert rsp.status_code == 400
+    rsp = requests.post(url, data=json.dumps({'create': [{'clientName': 'x', 'tier': ['Gold']}]}),
+                        headers=dict(headers, **{'content-type': 'application/json'}))
+    assert rsp.status_code == 400
+    # names whose URL belongs to another resource:
+    rsp = requests.post(url, data=json.dumps({'create': ['_batch', 'agave_clients_testsuite/subscriptions']}),
+                        headers=dict(headers, **{'content-type': 'application/json'}))
+    assert rsp.status_code == 400
+
+def test_delete_clients_batch(headers, batch_client_names):
+    url = '{}/clients/v2/_batch'.format(BASE_URL)
+    rsp = requests.post(url, data=json.dumps({'delete': batch_client_names}),
+                        headers=dict(headers, **{'content-type': 'application/json'}))
+    results = validate_response(rsp)
+    assert sorted(r['clientName'] for r in results) == sorted(batch_client_names)
+    assert all(r['status'] == 'success' for r in results)
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.get(url, headers=headers)
+    names = [client.get('name') for client in validate_response(rsp)]
+    assert not set(names) & set(batch_client_names)
+
+def test_create_client_with_slashes(headers, slash_client_attrs):
+    url = '{}/clients/v2'.format(BASE_URL)
+    rsp = requests.post(url, data=slash_client_attrs, headers=headers)
+    client = validate_response(rsp)
+    validate_client(client, secret_present=True)
+    assert client['_links']['self']['href'].endswith('/clients/v2/' + slash_client_attrs.get('clientName'))
+
+def test_client_with_slashes_details(headers, slash_client_attrs):
+    # with and without a trailing slash.
+    for url in ['{}/clients/v2/{}', '{}/clients/v2/{}/']:
+        rsp = requests.get(url.format(BASE_URL, slash_client_attrs.get('clientName')), headers=headers)
+        client = validate_response(rsp)
+        validate_client(client)
+        assert client.get('name') == slash_client_attrs.get('clientName')
+
+def test_client_with_slashes_subscriptions(headers, slash_client_attrs):
+    # the last segment names the resource, the rest is the client name.
+    for url in ['{}/clients/v2/{}/subscriptions', '{}/clients/v2/{}/subscriptions/']:
+        rsp = requests.get(url.format(BASE_URL, slash_client_attrs.get('clientName')), headers=headers)
+        subs = validate_response(rsp)
+        assert len(subs) >= len(AGAVE_APIS)
+        for sub in subs:
+            validate_subscription(sub)
+            assert sub['_links']['client']['href'].endswith('/clients/v2/' + slash_client_attrs.get('clientName'))
+
+def test_delete_client_with_slashes(headers, slash_client_attrs):
+    url = '{}/clients/v2/{}/'.format(BASE_URL, slash_client_attrs.get('clientName'))
+    rsp = requests.delete(url, headers=headers)
+    validate_response(rsp)
+    rsp = requests.get('{}/clients/v2'.format(BASE_URL), headers=headers)
+    names = [client.get('name') for client in validate_response(rsp)]
+    assert slash_client_attrs.get('clientName') not in names
+
+def test_create_client_reserved_name(headers):
+    url = '{}/clients/v2'.format(BASE_URL)
+    for name in ['_metrics', 'agave_clients_testsuite/subscriptions', 'agave_clients_testsuite/provisioning/']:
+        rsp = requests.post(url, data={'clientName': name}, headers=headers)
+        assert rsp.status_code == 400
+        rsp = requests.post(url, data={'clientName': name, 'async': 'true'}, headers=headers)
+        assert rsp.status_code == 400
@@ -1,24 +1,18 @@
-from django.conf.urls import patterns, include, url
-from django.contrib import admin
-from rest_framework.urlpatterns import format_suffix_patterns
+from django.conf.urls import patterns
 
 from agave_clients.service import views
-
-admin.autodiscover()
+from agave_clients.service.routing import ClientResolver
 
 urlpatterns = patterns('',
 
-    # rest API:
-    url(r'clients/v2/(?P<client_name>.*[^/])/subscriptions/$', views.ClientSubscriptions.as_view(),
-        name='client_subscriptions'),
-    url(r'clients/v2/(?P<client_name>.*[^/])/subscriptions$', views.ClientSubscriptions.as_view()),
-
-    url(r'clients/v2/(?P<client_name>.*[^/])/$', views.ClientDetails.as_view()),
-    url(r'clients/v2/(?P<client_name>.*[^/])$', views.ClientDetails.as_view(), name='client_details'),
-
-    url(r'clients/v2/', views.Clients.as_view(), name='clients'),
-    url(r'clients/v2', views.Clients.as_view()),
-
+    # rest API: clients/v2[/{client_name}[/{resource}]]; client names may contain slashes.
+    ClientResolver(r'^clients/v2', [
+        ('', views.Clients.as_view(), 'clients'),
+        ('_metrics', views.Metrics.as_view(), 'metrics'),
+        ('_batch', views.ClientBatch.as_view(), 'client_batch'),
+    ], [
+        ('provisioning', views.ClientProvisioning.as_view(), 'client_provisioning'),
+        ('subscriptions', views.ClientSubscriptions.as_view(), 'client_subscriptions'),
+        (None, views.ClientDetails.as_view(), 'client_details'),
+    ]),
 )
-
-urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
@@ -24,3 +24,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "agave_clients.settings")
 # setting points here.
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
+
+# mod_wsgi preloads this module in each daemon process (see deployment/apache2.conf); check that the
+# processes share their state and warm the process up before it takes any traffic.
+from django.conf import settings
+from agave_clients.service import startup
+startup.check_shared_state()
+if settings.STARTUP_WARM_UP:
+    startup.warm_up()